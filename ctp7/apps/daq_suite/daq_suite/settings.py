@@ -106,3 +106,17 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/1.9/howto/static-files/
 
 STATIC_URL = '/static/'
+
+
+# Register snapshots
+# Register values shown by the module views are read at most once per this many seconds (per module and worker process),
+# all requests within that time get the same snapshot
+
+DAQ_SUITE_SNAPSHOT_TTL = 1.0
+
+# Live monitoring
+# One background thread per worker reads these modules every DAQ_SUITE_STREAM_INTERVAL seconds and pushes the changed values
+# to all clients of the stream (server-sent events) and poll (long-poll) views
+
+DAQ_SUITE_STREAM_MODULES = ['GEM_AMC.GEM_SYSTEM']
+DAQ_SUITE_STREAM_INTERVAL = 1.0
@@ -23,4 +23,8 @@ urlpatterns = [
     url(r'^hello/', hello),
     url(r'^read_fw/', read_fw),
     url(r'^read_gem_system_module/', read_gem_system_module),
+    url(r'^read_module/(?P<module>[\w.]+)/$', read_module),
+    url(r'^module_json/(?P<module>[\w.]+)/$', module_json),
+    url(r'^stream/$', stream),
+    url(r'^poll/$', poll),
 ]
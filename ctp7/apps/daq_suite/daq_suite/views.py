@@ -1,23 +1,188 @@
-from django.http import HttpResponse
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse, Http404
 from django.template import Template, Context
 from django.shortcuts import render
+from django.conf import settings
 from rw_reg import *
+import rw_reg
+import threading, time, json, collections, uuid
+
+# the address table is parsed once per worker process, on the first request that needs it (under the rw_reg table lock,
+# which also serializes the lookups of the other request threads against the parsing)
+tableLoaded = False
+
+def loadTable():
+  global tableLoaded
+  with rw_reg.tableLock:
+    if not tableLoaded:
+      parseXML()
+      tableLoaded = True
+
+# Last read values of all readable registers below a node. Concurrent requests for the same module share one coalesced
+# read: whoever finds the snapshot older than DAQ_SUITE_SNAPSHOT_TTL reads it again while the others wait for the result.
+class Snapshot:
+
+  def __init__(self, node):
+    regs = []
+    getAllChildren(node, regs)
+    self.regs = [reg for reg in regs if isReadable(reg)]
+    self.names = [reg.name for reg in self.regs]
+    self.addresses = [reg.real_address for reg in self.regs]
+    self.plan = ReadPlan(self.regs)
+    self.lock = threading.Lock()
+    self.timestamp = None
+    self.values = None
+
+  # returns (timestamp, values), values being ints, or error strings for registers that could not be read
+  def get(self):
+    with self.lock:
+      if self.timestamp is None or time.time() - self.timestamp > getattr(settings, 'DAQ_SUITE_SNAPSHOT_TTL', 1.0):
+        self.values = [str(value) if isinstance(value, BusError) else value for value in self.plan.read()]
+        self.timestamp = time.time()
+      return self.timestamp, self.values
+
+snapshotsLock = threading.Lock()
+snapshots = {}
+
+def getSnapshot(moduleName):
+  loadTable()
+  with snapshotsLock:
+    snapshot = snapshots.get(moduleName)
+    if snapshot is None:
+      node = getNode(moduleName)
+      if node is None:
+        raise Http404('%s not found' % moduleName)
+      snapshot = snapshots[moduleName] = Snapshot(node)
+  return snapshot
+
+def formatValue(value):
+  if isinstance(value, str): return value
+  return '{0:#010x}'.format(value)
 
 def hello(request):
   return HttpResponse('Hello World')
 
 def read_fw(request):
-  parseXML()
+  loadTable()
   reg=getNode("GEM_AMC.GEM_SYSTEM.BOARD_ID")
-  print reg
   return HttpResponse('Board ID %s'%(readReg(reg)))
 
-def read_gem_system_module(request):
-  parseXML()
-  reglist = getRegsContaining("GEM_AMC.GEM_SYSTEM")
-  valuelist = []
-  for reg in reglist:
-    try: valuelist.append(readReg(reg))
-    except: print reg
-  ziplist = zip(list(reg.name for reg in reglist),valuelist)
+def read_module(request, module):
+  snapshot = getSnapshot(module)
+  timestamp, values = snapshot.get()
+  ziplist = zip(snapshot.names, [formatValue(value) for value in values])
   return render(request,'module.html',{'ziplist':ziplist})
+
+def read_gem_system_module(request):
+  return read_module(request, "GEM_AMC.GEM_SYSTEM")
+
+# the cached snapshot of a module as JSON: {"module": ..., "timestamp": ..., "registers": [{"name": ..., "address": ..., "value": ...}, ...]}
+def module_json(request, module):
+  snapshot = getSnapshot(module)
+  timestamp, values = snapshot.get()
+  registers = [{'name': name, 'address': address, 'value': value} for name, address, value in zip(snapshot.names, snapshot.addresses, values)]
+  return JsonResponse({'module': module, 'timestamp': timestamp, 'registers': registers})
+
+# One background thread reads the registers of DAQ_SUITE_STREAM_MODULES every DAQ_SUITE_STREAM_INTERVAL seconds and publishes
+# the values that changed as a new version. The stream and poll views of all clients just wait for new versions, so the
+# hardware load doesn't depend on the number of clients.
+# Versions only mean something to the poller that made them (every worker process has its own, and they start over when
+# the server restarts), so clients get them together with the epoch of the poller, and a client that comes with another
+# epoch (or a version this poller hasn't reached) gets the full state instead of a diff.
+class Poller(threading.Thread):
+
+  HISTORY = 100 # versions kept for clients that fall behind, older clients get the full state again
+
+  def __init__(self, regs, interval):
+    threading.Thread.__init__(self)
+    self.daemon = True
+    self.names = [reg.name for reg in regs]
+    self.plan = ReadPlan(regs)
+    self.interval = interval
+    self.condition = threading.Condition()
+    self.epoch = uuid.uuid4().hex[:12]
+    self.version = 0
+    self.values = None
+    self.history = collections.deque(maxlen=self.HISTORY) # (version, {name: value} changed since the previous version)
+
+  def run(self):
+    nextPoll = time.time()
+    while True:
+      try: self.publish([str(value) if isinstance(value, BusError) else value for value in self.plan.read()])
+      except Exception as e: print 'Register poller:',str(e)
+      nextPoll += self.interval
+      time.sleep(max(0, nextPoll - time.time()))
+
+  def publish(self, values):
+    with self.condition:
+      if values == self.values:
+        return
+      if self.values is None: changes = dict(zip(self.names, values))
+      else: changes = dict((name, value) for name, value, old in zip(self.names, values, self.values) if value != old)
+      self.values = values
+      self.version += 1
+      self.history.append((self.version, changes))
+      self.condition.notify_all()
+
+  # waits (at most timeout seconds) for a version newer than the given one and returns (epoch, latest version, values changed
+  # since the given version), or all values if the given version is 0, no longer in the history or from another epoch
+  def getChanges(self, epoch, version, timeout):
+    with self.condition:
+      if epoch != self.epoch or version > self.version:
+        version = 0
+      if self.version <= version:
+        self.condition.wait(timeout)
+      if self.version <= version:
+        return self.epoch, version, {}
+      if version <= 0 or version < self.history[0][0] - 1:
+        return self.epoch, self.version, dict(zip(self.names, self.values))
+      changes = {}
+      for historyVersion, historyChanges in self.history:
+        if historyVersion > version:
+          changes.update(historyChanges)
+      return self.epoch, self.version, changes
+
+pollerLock = threading.Lock()
+poller = None
+
+def getPoller():
+  global poller
+  loadTable()
+  with pollerLock:
+    if poller is None:
+      regs = []
+      for module in getattr(settings, 'DAQ_SUITE_STREAM_MODULES', ['GEM_AMC.GEM_SYSTEM']):
+        node = getNode(module)
+        if node is None:
+          print 'Register poller:',module,'not found'
+          continue
+        getAllChildren(node, regs)
+      poller = Poller([reg for reg in regs if isReadable(reg)], getattr(settings, 'DAQ_SUITE_STREAM_INTERVAL', 1.0))
+      poller.start()
+  return poller
+
+STREAM_KEEPALIVE = 15 # seconds
+
+def parseVersion(version):
+  try: return int(version)
+  except (TypeError, ValueError): return 0
+
+# server-sent events: the first event has all values, the following ones only the changed values, as {"name": value, ...}
+# the event id is <poller epoch>.<poller version>, so a browser reconnecting to the same poller (Last-Event-ID) only gets
+# what it missed, and one reconnecting to another worker or a restarted server gets the full state again
+def stream(request):
+  poller = getPoller()
+  epoch, _, version = request.META.get('HTTP_LAST_EVENT_ID', '').partition('.')
+  def events(epoch, version):
+    while True:
+      epoch, version, changes = poller.getChanges(epoch, version, STREAM_KEEPALIVE)
+      if len(changes) > 0: yield 'id: %s.%d\ndata: %s\n\n' % (epoch, version, json.dumps(changes))
+      else: yield ': keepalive\n\n'
+  response = StreamingHttpResponse(events(epoch, parseVersion(version)), content_type='text/event-stream')
+  response['Cache-Control'] = 'no-cache'
+  return response
+
+# long-poll alternative to the stream: poll/?epoch=E&version=N waits for changes after version N of epoch E (the full state
+# if E is not the epoch of the poller) and returns {"epoch": ..., "version": ..., "changes": {...}}
+def poll(request):
+  epoch, version, changes = getPoller().getChanges(request.GET.get('epoch'), parseVersion(request.GET.get('version')), STREAM_KEEPALIVE)
+  return JsonResponse({'epoch': epoch, 'version': version, 'changes': changes})
@@ -0,0 +1,31 @@
+# Install and packaging rules of the Python apps, included by their Makefiles after setting APP and APP_FILES.
+# The rw_reg.py of the apps is a link to scripts/rw_reg.py (one copy for the scripts and all the apps), so an app
+# directory must not be copied to the board as it is: "make install" puts the app in the rootfs host copy with the linked
+# files copied, "make dist" packs it in $(APP).tar.gz (unpacked as $(APP)/) to copy to the board by hand.
+
+APP_DIR ?= /usr/share/gemdaq/$(APP)
+
+all: install
+
+build:
+
+install:
+	@test -n "$(PETA_STAGE)" || (echo "Error: PETA_STAGE environment variable not set.  Change to the root of your PetaLinux install, and source the settings.sh file"; exit 1)
+	for f in `find -L $(APP_FILES) -type f ! -name '*.pyc'`; do $(TARGETINST) -d `readlink -f $$f` $(APP_DIR)/$$f || exit 1; done
+
+dist:
+	tar -chzf $(APP).tar.gz --exclude='*.pyc' --transform 's,^,$(APP)/,' $(APP_FILES)
+
+clean:
+	-rm -f $(APP).tar.gz
+
+.PHONY: all build install dist clean
+
+help:
+	@echo ""
+	@echo "Quick reference for various supported build targets for $(APP)."
+	@echo "----------------------------------------------------"
+	@echo "  clean                  clean out the package"
+	@echo "  all                    install $(APP) to rootfs host copy"
+	@echo "  install                install $(APP) to rootfs host copy ($(APP_DIR))"
+	@echo "  dist                   pack $(APP) with rw_reg.py in $(APP).tar.gz"
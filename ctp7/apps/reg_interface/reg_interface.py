@@ -1,6 +1,7 @@
 from cmd import Cmd
-import sys, os, subprocess
+import sys, os, subprocess, time
 from rw_reg import *
+import rw_reg
 
 
 
@@ -51,7 +52,7 @@ class Prompt(Cmd):
         return completeReg(text)
 
 
-    def do_readGroup(self, args): #INEFFICIENT
+    def do_readGroup(self, args):
         """Read all registers below node in register tree. USAGE: readGroup <register/node name> """
         node = getNode(args)
         if node is not None: 
@@ -59,8 +60,8 @@ class Prompt(Cmd):
             kids = []
             getAllChildren(node, kids)
             print len(kids),'CHILDREN'
-            for reg in kids: 
-                if 'r' in str(reg.permission): print displayReg(reg)
+            for line in displayRegs([reg for reg in kids if 'r' in str(reg.permission)]):
+                print line
         else: print args,'not found!'
 
     def complete_readGroup(self, text, line, begidx, endidx):
@@ -69,16 +70,20 @@ class Prompt(Cmd):
 
     def do_readFW(self, args):
         """Quick read of all FW-related registers"""
-        for reg in getNodesContaining('STATUS.FW'):
-            if 'r' in str(reg.permission): print hex(reg.real_address),reg.permission,'\t',tabPad(reg.name,4),readReg(reg)
+        regs = [reg for reg in getNodesContaining('STATUS.FW') or [] if 'r' in str(reg.permission)]
+        for reg, value in zip(regs, readRegs(regs)):
+            print hex(reg.real_address),reg.permission,'\t',tabPad(reg.name,4),value
 
     def do_readKW(self, args):
         """Read all registers containing KeyWord. USAGE: readKW <KeyWord>"""
-        if getNodesContaining(args) is not None and args!='':
-            for reg in getNodesContaining(args):
+        regs = getNodesContaining(args)
+        if regs is not None and args!='':
+            readable = [reg for reg in regs if 'r' in str(reg.permission)]
+            values = dict(zip(readable, readRegs(readable)))
+            for reg in regs:
                 address = reg.real_address
                 if 'r' in str(reg.permission):
-                    print hex(address).rstrip('L'),reg.permission,'\t',tabPad(reg.name,7),readReg(reg)
+                    print hex(address).rstrip('L'),reg.permission,'\t',tabPad(reg.name,7),values[reg]
                 elif reg.isModule: print hex(address).rstrip('L'),reg.permission,'\t',tabPad(reg.name,7) #,'Module!'
                 else: print hex(address).rstrip('L'),reg.permission,'\t',tabPad(reg.name,7) #,'No read permission!' 
         else: print args,'not found!'
@@ -87,8 +92,8 @@ class Prompt(Cmd):
 
     def do_readAll(self, args):
         """Read all registers with read-permission"""
-        for reg in getNodesContaining(''):
-            if 'r' in str(reg.permission): print displayReg(reg) 
+        for line in displayRegs(getRegsContaining('') or []):
+            print line
             
     def do_exit(self, args):
         """Exit program"""
@@ -126,6 +131,116 @@ class Prompt(Cmd):
             print mpoke(arglist[0],arglist[1])
         else: print "Incorrect number of arguments!"
 
+    def do_broadcast(self, args):
+        """Writes one register on a range of generated nodes in one batch. USAGE: broadcast <register name with ${VAR} for the indices> <register value> <VAR>=<first>-<last> ...
+        e.g. broadcast GEM_AMC.OH.OH${OH}.GEB.VFAT${VFAT}.CFG_LATENCY 45 OH=0-11 VFAT=0-23"""
+        arglist = args.split()
+        if len(arglist) < 3:
+            print "Incorrect number of arguments!"
+            return
+        try:
+            value = parseInt(arglist[1])
+            ranges = {}
+            for arg in arglist[2:]:
+                var, indices = arg.split('=')
+                first, last = indices.split('-') if '-' in indices else (indices, indices)
+                ranges[var] = range(int(first), int(last) + 1)
+        except ValueError:
+            print 'Value and ranges must be numbers!'
+            return
+        try:
+            broadcast = Broadcast(arglist[0], **ranges)
+            print len(broadcast),'registers,',broadcast.write(value),'words written'
+        except ValueError as e: print str(e)
+
+    def do_watch(self, args):
+        """Poll registers and print the ones that changed, with deltas and rates for counters. Stop with Ctrl-C. USAGE: watch <register/node name or KeyWord> [interval in seconds, default 1]"""
+        arglist = args.split()
+        if len(arglist) < 1 or len(arglist) > 2:
+            print "Incorrect number of arguments!"
+            return
+        try: interval = float(arglist[1]) if len(arglist) == 2 else 1.0
+        except ValueError:
+            print 'Interval must be a number!'
+            return
+        node = getNode(arglist[0])
+        if node is not None:
+            regs = []
+            getAllChildren(node, regs)
+            regs = [reg for reg in regs if 'r' in str(reg.permission)]
+        else: regs = getRegsContaining(arglist[0]) or []
+        if len(regs) == 0:
+            print arglist[0],'not found!'
+            return
+        watchRegs(regs, interval)
+
+    def complete_watch(self, text, line, begidx, endidx):
+        return completeReg(text)
+
+    def do_stats(self, args):
+        """Register access statistics. USAGE: stats [on|off|reset|<report file (.json or .csv)>], without arguments prints a summary"""
+        if args == 'on' or args == 'reset':
+            enableStats()
+            print 'Recording register access statistics.'
+        elif args == 'off':
+            disableStats()
+        elif rw_reg.stats is None:
+            print 'Statistics are off, enable them with: stats on'
+        elif args == '':
+            for line in rw_reg.stats.summary():
+                print line
+        else:
+            try:
+                dumpStats(args)
+                print 'Written to',args
+            except (IOError, OSError) as e: print 'Error writing',args,':',str(e)
+
+
+# Reads the registers with one ReadPlan per poll and prints only the ones whose value changed since the previous poll.
+# Counters (names ending in CNT or COUNT) also show the increment and the rate since their previous change.
+# Everything that doesn't depend on the value is formatted once up front, so a poll that sees no change costs one block read and a list compare.
+def watchRegs(regs, interval):
+    plan = ReadPlan(regs)
+    prefixes = [hex(reg.real_address).rstrip('L')+' '+reg.permission+'\t'+tabPad(reg.name,7) for reg in regs]
+    counters = [reg.name.endswith('CNT') or reg.name.endswith('COUNT') for reg in regs]
+    wraps = [1 << bin(0xffffffff if reg.mask is None else reg.mask).count('1') for reg in regs]
+    print 'Watching',len(regs),'registers every',interval,'s, Ctrl-C to stop'
+    start = time.time()
+    previous = plan.read()
+    changedAt = [start] * len(regs)
+    polls = 0
+    nextPoll = start + interval
+    try:
+        for prefix, value in zip(prefixes, previous):
+            print prefix + (str(value) if isinstance(value, BusError) else '{0:#010x}'.format(value))
+        while True:
+            now = time.time()
+            if nextPoll > now:
+                time.sleep(nextPoll - now)
+            nextPoll += interval
+            values = plan.read()
+            polls += 1
+            if values == previous:
+                continue
+            now = time.time()
+            for i, (value, old) in enumerate(zip(values, previous)):
+                if value == old:
+                    continue
+                if isinstance(value, BusError):
+                    if not isinstance(old, BusError) or str(old) != str(value):
+                        print '%10.3f %s%s' % (now - start, prefixes[i], value)
+                    continue
+                line = '%10.3f %s%s' % (now - start, prefixes[i], '{0:#010x}'.format(value))
+                if counters[i] and not isinstance(old, BusError):
+                    delta = (value - old) % wraps[i]
+                    line += '  +%d (%.1f/s)' % (delta, delta / (now - changedAt[i]))
+                print line
+                changedAt[i] = now
+            previous = values
+    except KeyboardInterrupt:
+        elapsed = time.time() - start
+        print
+        print polls,'polls in %.1f s (%.1f Hz)' % (elapsed, polls / elapsed if elapsed > 0 else 0)
 
 if __name__ == '__main__':
     try:
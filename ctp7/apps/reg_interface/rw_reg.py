@@ -0,0 +1 @@
+../../../scripts/rw_reg.py
\ No newline at end of file
@@ -250,13 +250,9 @@ def scan_vfat(vfat_slot, outfile):
         print 'Trigger Counter Reset did not clear Trigger Counts!',Colors.ENDC
         print 'Triggers:',nSbits,'=',parseInt(nSbits),'\n'
 
-        for reg in getNodesContaining('TRIGGER.OH'+str(OH_NUM)+'.CLUSTER'):
-            if 'r' in str(reg.permission):
-                print displayReg(reg),'=',parseInt(str(readReg(reg)))
+        printRegs(queryNodes('GEM_AMC.TRIGGER.OH%d.CLUSTER*.**' % OH_NUM).readable())
         print '\n'
-        for reg in getNodesContaining('TRIGGER.OH'+str(OH_NUM)+'.DEBUG_LAST_CLUSTER'):
-            if 'r' in str(reg.permission):
-                print displayReg(reg,'hexbin')
+        printRegs(queryNodes('GEM_AMC.TRIGGER.OH%d.DEBUG_LAST_CLUSTER*.**' % OH_NUM).readable(), 'hexbin')
         return
     else: print 'Trigger Counts clear.'
 
@@ -302,13 +298,9 @@ def scan_vfat(vfat_slot, outfile):
                 print 'Trigger Counter Reset did not clear Trigger Counts!',Colors.ENDC
                 print 'Triggers:',nSbits,'=',parseInt(nSbits),'\n'
         
-                for reg in getNodesContaining('TRIGGER.OH'+str(OH_NUM)+'.CLUSTER'):
-                    if 'r' in str(reg.permission):
-                        print displayReg(reg),'=',parseInt(str(readReg(reg)))
+                printRegs(queryNodes('GEM_AMC.TRIGGER.OH%d.CLUSTER*.**' % OH_NUM).readable())
                 print '\n'
-                for reg in getNodesContaining('TRIGGER.OH'+str(OH_NUM)+'.DEBUG_LAST_CLUSTER'):
-                    if 'r' in str(reg.permission):
-                        print displayReg(reg,'hexbin')
+                printRegs(queryNodes('GEM_AMC.TRIGGER.OH%d.DEBUG_LAST_CLUSTER*.**' % OH_NUM).readable(), 'hexbin')
                 return
             else: print 'Trigger Counts clear.'
 
@@ -336,12 +328,8 @@ def scan_vfat(vfat_slot, outfile):
             # Map Cluster
             if not QUICKTEST:
                 subheading('Cluster Info')
-                for reg in getNodesContaining('TRIGGER.OH'+str(OH_NUM)+'.CLUSTER'):
-                    if 'r' in str(reg.permission):
-                        print displayReg(reg),'=',parseInt(str(readReg(reg)))
-                for reg in getNodesContaining('TRIGGER.OH'+str(OH_NUM)+'.DEBUG_LAST_CLUSTER'):
-                    if 'r' in str(reg.permission):
-                        print displayReg(reg),'=',parseInt(str(readReg(reg)))
+                printRegs(queryNodes('GEM_AMC.TRIGGER.OH%d.CLUSTER*.**' % OH_NUM).readable())
+                printRegs(queryNodes('GEM_AMC.TRIGGER.OH%d.DEBUG_LAST_CLUSTER*.**' % OH_NUM).readable())
 
             print writeReg(getNode(REG_PATH + 'VFATChannels.ChanReg' + str(strip)), 0)
 
@@ -396,6 +384,12 @@ def cluster_to_size (cluster):
 
 
 
+# reads all the registers of the set at once and prints them (followed by the decimal value unless option is 'hexbin')
+def printRegs(regs, option=None):
+    for reg, value in zip(regs, regs.read()):
+        if option == 'hexbin' or isinstance(value, BusError): print formatDisplay(reg, value, option)
+        else: print formatDisplay(reg, value),'=',value
+
 def heading(string):
     print Colors.BLUE
     print '\n>>>>>>> '+str(string).upper()+' <<<<<<<'
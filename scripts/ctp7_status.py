@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+
+# Dumps the readable registers of firmware modules, like the generated ctp7_status.sh did, but reading each module with
+# a few block reads (one per contiguous run of addresses) instead of forking one mpeek per register.
+# The register layout is written by generate_registers.py to ctp7_status_layout.json, which is looked for next to this
+# script by default.
+# The AMC modules always respond, so they are read straight from the mapped AXI window. The OH module is forwarded over
+# the OH links: it is slow (a slow control transaction per word), and a link that is down would kill a process reading
+# it through the window (see rw_reg.MmapBackend), so it is only dumped when asked for by name, with mpeek / mpoke.
+# Setting RW_REG_BACKEND overrides the backend of the AMC modules (and of the OH module, unless it is set to mmap).
+
+import argparse
+import os, sys, json, mmap
+from rw_reg import BusError, MmapBackend, SubprocessBackend, getBackend, setBackend, makeBlocks, readBlocks
+
+STATUS_LAYOUT_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ctp7_status_layout.json')
+TOP_NODE_NAME = 'GEM_AMC'
+REMOTE_MODULES = ['OH'] # not part of the default module set, see above
+
+# returns the layouts of the given modules (e.g. TTC, or all but the REMOTE_MODULES if none are given) and the names of all modules
+def loadLayouts(filename, moduleNames):
+    layouts = []
+    allNames = []
+    f = open(filename, 'r')
+    for line in f:
+        name = line[len('{"name":"' + TOP_NODE_NAME + '.'):line.index('"', len('{"name":"'))]
+        allNames.append(name)
+        if name in moduleNames or (len(moduleNames) == 0 and name not in REMOTE_MODULES):
+            layouts.append(json.loads(line))
+    f.close()
+    return layouts, allNames
+
+# returns the field values of a module in the order of its layout (BusError instances for the words that failed)
+def readModule(layout):
+    base = layout['address']
+    addresses = sorted(set(base + (offset << 2) for name, offset, mask, lsb in layout['regs']))
+    words = dict(zip(addresses, readBlocks(makeBlocks(addresses))))
+    values = []
+    for name, offset, mask, lsb in layout['regs']:
+        word = words[base + (offset << 2)]
+        values.append(word if isinstance(word, BusError) else (word & mask) >> lsb)
+    return values
+
+# returns the backends for the AMC modules and for the REMOTE_MODULES
+def getBackends():
+    if 'RW_REG_BACKEND' in os.environ:
+        local = getBackend()
+    else:
+        try: local = MmapBackend()
+        except (OSError, IOError, ValueError, mmap.error): local = SubprocessBackend()
+    return local, SubprocessBackend() if local.name == 'mmap' else local
+
+def printModule(layout, values):
+    for reg, value in zip(layout['regs'], values):
+        name = layout['name'] + '.' + reg[0]
+        if isinstance(value, BusError): print '%s = %s' % (name.ljust(45), value)
+        else: print '%s = 0x%x' % (name.ljust(45), value)
+
+def main():
+    parser = argparse.ArgumentParser(description='Dumps the status registers of the firmware modules.')
+    parser.add_argument('modules', metavar='module', nargs='*',
+                   help='Optional: modules to dump, e.g. TTC DAQ (default all modules except %s, which have to be named)' % ' '.join(REMOTE_MODULES))
+    parser.add_argument('-l', metavar='layout_file', default=STATUS_LAYOUT_FILE,
+                   help='Optional: register layout written by generate_registers.py (default %s)' % STATUS_LAYOUT_FILE)
+    parser.add_argument('-j', action='store_true',
+                   help='Optional: print JSON ({module: {register: value}}, bus errors as strings) instead of one line per register')
+    args = parser.parse_args()
+
+    layouts, allNames = loadLayouts(args.l, args.modules)
+    unknown = [name for name in args.modules if name not in allNames]
+    if len(unknown) > 0:
+        print 'Unknown module(s):', ' '.join(unknown)
+        print 'Available modules:', ' '.join(allNames)
+        sys.exit(1)
+
+    localBackend, remoteBackend = getBackends()
+    dump = {}
+    for layout in layouts:
+        setBackend(remoteBackend if layout['name'][len(TOP_NODE_NAME) + 1:] in REMOTE_MODULES else localBackend)
+        values = readModule(layout)
+        if args.j:
+            dump[layout['name']] = dict((layout['name'] + '.' + reg[0], str(value) if isinstance(value, BusError) else value) for reg, value in zip(layout['regs'], values))
+        else:
+            printModule(layout, values)
+    if args.j:
+        json.dump(dump, sys.stdout, indent=1, sort_keys=True)
+        print
+
+if __name__ == '__main__':
+    main()
@@ -109,8 +109,8 @@ def main():
                     writeReg(getNode('GEM_AMC.GEM_SYSTEM.CTRL.LINK_RESET'), 1)
                     # wReg(ADDR_LINK_RESET, 1)
                     sleep(0.3)
-                    linkGood = parseInt(readReg(getNode('GEM_AMC.OH_LINKS.OH%d.VFAT%d.LINK_GOOD' % (ohSelect, vfat))))
-                    syncErrCnt = parseInt(readReg(getNode('GEM_AMC.OH_LINKS.OH%d.VFAT%d.SYNC_ERR_CNT' % (ohSelect, vfat))))
+                    linkGood = readValue(getNode('GEM_AMC.OH_LINKS.OH%d.VFAT%d.LINK_GOOD' % (ohSelect, vfat)))
+                    syncErrCnt = readValue(getNode('GEM_AMC.OH_LINKS.OH%d.VFAT%d.SYNC_ERR_CNT' % (ohSelect, vfat)))
                     cfgRun = readReg(getNode('GEM_AMC.OH.OH%d.GEB.VFAT%d.CFG_RUN' % (ohSelect, vfat)))
                     color = Colors.GREEN
                     prefix = 'GOOD: '
@@ -185,7 +185,7 @@ def selectGbt(ohIdx, gbtIdx):
     return 0
 
 def checkGbtReady(ohIdx, gbtIdx):
-    return parseInt(readReg(getNode('GEM_AMC.OH_LINKS.OH%d.GBT%d_READY' % (ohIdx, gbtIdx))))
+    return readValue(getNode('GEM_AMC.OH_LINKS.OH%d.GBT%d_READY' % (ohIdx, gbtIdx)))
 
 def check_bit(byteval,idx):
     return ((byteval&(1<<idx))!=0);
@@ -2,15 +2,18 @@ __author__ = 'evka'
 
 import xml.etree.ElementTree as xml
 import textwrap as tw
-import sys
-import rw_reg
+import sys, os, re, keyword
+import multiprocessing
+import hashlib, json, StringIO
 
 ADDRESS_TABLE_TOP = './address_table/gem_amc_top.xml'
 CONSTANTS_FILE = '../common/hdl/pkg/registers.vhd'
-BASH_STATUS_SCRIPT_FILE ='./ctp7_bash_scripts/generated/ctp7_status.sh'
+STATUS_LAYOUT_FILE = './ctp7_status_layout.json' # read by ctp7_status.py
 BASH_REG_READ_SCRIPT_FILE='./ctp7_bash_scripts/generated/reg_read.sh'
 UHAL_ADDRESS_TABLE_FILE_CTP7='./address_table/uhal_gem_amc_ctp7'
 UHAL_ADDRESS_TABLE_FILE_GLIB='./address_table/uhal_gem_amc_glib'
+PYTHON_ACCESSOR_FILE='./gem_amc_regs.py'
+PYTHON_ACCESSOR_TOP_NAME = 'gem'
 
 TOP_NODE_NAME = 'GEM_AMC'
 VHDL_REG_CONSTANT_PREFIX = 'REG_'
@@ -39,6 +42,8 @@ class Module:
     masterBus = ''
     slaveBus = ''
     isExternal = False # if this is true it means that firmware doesn't have to be modified, only bash scripts will be generated
+    inputHash = None # see incremental generation
+    isCached = False # true if the registers were not expanded because nothing changed since the last run
 
     def __init__(self):
         self.regs = []
@@ -117,6 +122,31 @@ class Register:
     def getVhdlName(self):
         return self.name.replace(TOP_NODE_NAME + '.', '').replace('.', '_')
 
+# one node of the expanded address table tree, built by findRegisters in the same pass as the modules and registers
+# (address is absolute, reg is the Register if this node is one)
+# template is set on generated copies whose subtrees only differ in the addresses: it's the first copy, whose rendered
+# children can be reused for all of them (see printNodeToUHALFile)
+# generate is set on all generated copies to the (id before the index, id after the index, address step, number of copies)
+# of their generate node, which is the same object for all the copies, and index to the index of the copy
+# module is set on the top node of a module to its Module. The top node of a module that wasn't expanded (Module.isCached)
+# has no children: the parts of the outputs that come from it are read from the cache instead (see getModuleSection)
+class Node(object):
+    __slots__ = ('name', 'address', 'mask', 'permission', 'mode', 'size', 'reg', 'template', 'generate', 'index', 'module', 'children')
+
+    def __init__(self, name, address):
+        self.name = name
+        self.address = address
+        self.mask = None
+        self.permission = None
+        self.mode = None
+        self.size = None
+        self.reg = None
+        self.template = None
+        self.generate = None
+        self.index = None
+        self.module = None
+        self.children = []
+
 def main():
     print('Hi, parsing this top address table file: ' + ADDRESS_TABLE_TOP)
 
@@ -124,11 +154,21 @@ def main():
     num_of_oh = 4
     station = "1"
 
+    global incremental, uhalModules
+    if '--incremental' in sys.argv:
+        incremental = True
+        sys.argv.remove('--incremental')
+    if '--uhal-modules' in sys.argv:
+        uhalModules = True
+        sys.argv.remove('--uhal-modules')
+
     if len(sys.argv) < 2:
-        print('Usage: generate_registers.py <board_type> [num_of_oh] [gem_station]')
+        print('Usage: generate_registers.py [--incremental] [--uhal-modules] <board_type> [num_of_oh] [gem_station]')
         print('board_type can be: ctp7 or glib')
         print('num_of_oh is optional. if supplied, the script will substitute generate_size with this value when generating registers in the firmware. Note that this is not affecting the uHAL xml file generation.')
         print('gem_station: 0 for ME0, 1 for GE1/1, and 2 for GE2/1 (set to 1 by default)')
+        print('--incremental: only expand and regenerate the modules of the address table that changed since the last run, and only write the outputs that changed (or that were modified since then)')
+        print('--uhal-modules: write the repeated subtrees (OH, GEB, VFAT...) of the uHAL address tables once to module files, which the tables include with module="file://..."')
         return
     else:
         if sys.argv[1] != 'ctp7' and sys.argv[1] != 'glib':
@@ -148,13 +188,25 @@ def main():
             station = sys.argv[3]
             print('GEM station = %s' % station)
 
+    if board_type == 'ctp7':
+        uhalStep, uhalFilename, uhalOffset = 'uhal ctp7', UHAL_ADDRESS_TABLE_FILE_CTP7, 0
+    else:
+        uhalStep, uhalFilename, uhalOffset = 'uhal glib', UHAL_ADDRESS_TABLE_FILE_GLIB, GLIB_IPB_BASE_ADDRESS
+
+    loadManifest()
+    requiredSections.extend(['constants', 'layout', 'accessors'] if board_type == 'ctp7' else ['constants'])
+    requiredSections.extend(getUHalSection(filename) for filename, addrOffset, link in getUHalFiles(uhalFilename, uhalOffset, num_of_oh))
+    uhalHash = hashTreeInput(ADDRESS_TABLE_TOP, (uhalOffset, num_of_oh, station, uhalModules))
+    accessorHash = hashTreeInput(ADDRESS_TABLE_TOP, (AXI_IPB_BASE_ADDRESS, num_of_oh, station))
+
     tree = xml.parse(ADDRESS_TABLE_TOP)
     root = tree.getroot()[0]
 
     modules = []
     vars = {}
+    top = Node('top', 0x0)
 
-    findRegisters(root, '', 0x0, modules, None, vars, False, num_of_oh, station)
+    findRegisters(root, '', 0x0, modules, None, vars, False, num_of_oh, station, top)
 
     print('Modules:')
     for module in modules:
@@ -165,21 +217,186 @@ def main():
         for reg in module.regs:
             print(reg.toString())
 
+    allModulesHash = hashModules(modules)
+
     print('Writing constants file to ' + CONSTANTS_FILE)
-    writeConstantsFile(modules, CONSTANTS_FILE)
+    runStep('constants', allModulesHash, writeConstantsFile, modules, CONSTANTS_FILE)
 
     for module in modules:
         if not module.isExternal:
-            updateModuleFile(module)
+            runStep('module ' + module.name, module.inputHash, updateModuleFile, module)
 
     if board_type == 'ctp7':
-        writeStatusBashScript(modules, BASH_STATUS_SCRIPT_FILE)
+        runStep('status layout', allModulesHash, writeStatusLayout, modules, STATUS_LAYOUT_FILE)
+        runStep('python accessors', accessorHash, writePythonAccessors, top.children[0], PYTHON_ACCESSOR_FILE, AXI_IPB_BASE_ADDRESS)
         #writeRegReadBashScript(modules, BASH_REG_READ_SCRIPT_FILE)
-        writeUHalAddressTable(modules, UHAL_ADDRESS_TABLE_FILE_CTP7, 0, num_of_oh)
-    elif board_type == 'glib':
-        writeUHalAddressTable(modules, UHAL_ADDRESS_TABLE_FILE_GLIB, GLIB_IPB_BASE_ADDRESS, num_of_oh)
+    runStep(uhalStep, uhalHash, writeUHalAddressTable, top.children[0], uhalFilename, uhalOffset, num_of_oh)
+
+    saveManifest(modules)
+    printReport()
+
+########## incremental generation ##########
+#
+# Every output is written through an OutputFile, which leaves the file alone if the new content is the same as what's on
+# disk, so unchanged outputs keep their timestamps and don't trigger a re-synthesis.
+# Each generation step (the constants file, one module file, the status layout, the uHAL tables) is recorded in the
+# manifest with a hash of its input and of every file it wrote. With --incremental a step is skipped if its input hash
+# is the same as in the last run and its outputs still have the recorded content.
+# The input of a module is its XML subtree plus everything its expansion depends on (base address, generate variables,
+# num_of_oh, station and the generator itself), which determines its registers and its subtree. A module whose input
+# didn't change isn't even expanded: its parts of the files that cover all modules (constants file, status layout, uHAL
+# tables, Python accessors) are kept in GENERATOR_CACHE_DIR and reused, and it's left in the tree as a node without children.
+# So e.g. changing a fw_signal only regenerates that module's VHDL file, and changing a mask in TTC expands and renders
+# TTC only, and puts the other files back together from the cached parts of the other modules.
+
+GENERATOR_CACHE_DIR = './generate_registers_cache' # manifest and per module sections of the last run
+MANIFEST_FILE = GENERATOR_CACHE_DIR + '/manifest.json'
+TREE_HASH_ATTRIBUTES = ['id', 'address', 'mask', 'permission', 'mode', 'size', 'generate', 'generate_size', 'generate_address_step', 'generate_idx_var', 'gem_stations', 'fw_is_module']
+
+incremental = False
+requiredSections = [] # the per module sections the outputs of this run are made of
+manifest = {'steps': {}, 'modules': {}} # steps: step name -> {'input': hash, 'outputs': {filename: hash}}, modules: module name -> input hash
+currentStep = None # manifest entry of the step that is running
+report = {'written': [], 'unchanged': [], 'skipped': []}
+
+class OutputFile:
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.parts = []
+
+    def write(self, string):
+        self.parts.append(string)
+
+    def close(self):
+        content = ''.join(self.parts)
+        recordOutput(self.filename, writeIfChanged(self.filename, content), hashString(content))
+
+# returns true if the file had to be written
+def writeIfChanged(filename, content):
+    if readFile(filename) == content:
+        return False
+    f = open(filename, 'w')
+    f.write(content)
+    f.close()
+    return True
+
+def recordOutput(filename, written, contentHash):
+    report['written' if written else 'unchanged'].append(filename)
+    if currentStep is not None:
+        currentStep['outputs'][filename] = contentHash
+
+def isStepUpToDate(name, inputHash):
+    step = manifest['steps'].get(name)
+    if step is None or step['input'] != inputHash:
+        return False
+    for filename, outputHash in step['outputs'].items():
+        if hashString(readFile(filename)) != outputHash:
+            return False
+    return True
+
+# runs function(*args) unless this step can be skipped in incremental mode
+def runStep(name, inputHash, function, *args):
+    global currentStep
+    if incremental and isStepUpToDate(name, inputHash):
+        print('Skipping ' + name + ' (no changes since the last run)')
+        report['skipped'].extend(manifest['steps'][name]['outputs'].keys())
+        return
+    currentStep = manifest['steps'][name] = {'input': inputHash, 'outputs': {}}
+    try:
+        function(*args)
+    except:
+        del manifest['steps'][name] # don't trust whatever it may have written
+        raise
+    finally:
+        currentStep = None
+
+# a module can be used without expanding it if nothing it is made of changed, all the sections needed from it are cached,
+# and (if it has one) its VHDL file doesn't need to be updated
+def isModuleCached(module):
+    if not incremental or manifest['modules'].get(module.name) != module.inputHash:
+        return False
+    for section in requiredSections:
+        if (section != 'constants' or not module.isExternal) and not os.path.exists(getSectionFilename(module, section)):
+            return False
+    return module.isExternal or isStepUpToDate('module ' + module.name, module.inputHash)
+
+def getSectionFilename(module, section):
+    return os.path.join(GENERATOR_CACHE_DIR, module.name + '.' + section)
+
+# returns the part of a file covering all modules that comes from this one: written by writer(module, file), or read
+# back from the cache for a module that wasn't expanded
+def getModuleSection(module, section, writer):
+    if module.isCached:
+        return readFile(getSectionFilename(module, section))
+    content = StringIO.StringIO()
+    writer(module, content)
+    f = open(getSectionFilename(module, section), 'w')
+    f.write(content.getvalue())
+    f.close()
+    return content.getvalue()
+
+def loadManifest():
+    if not os.path.isdir(GENERATOR_CACHE_DIR):
+        os.makedirs(GENERATOR_CACHE_DIR)
+    if os.path.exists(MANIFEST_FILE):
+        f = open(MANIFEST_FILE, 'r')
+        manifest.update(json.load(f))
+        f.close()
+
+def saveManifest(modules):
+    manifest['modules'] = dict((module.name, module.inputHash) for module in modules)
+    f = open(MANIFEST_FILE, 'w')
+    json.dump(manifest, f, indent=1, sort_keys=True)
+    f.close()
 
-def findRegisters(node, baseName, baseAddress, modules, currentModule, vars, isGenerated, num_of_oh, station):
+def printReport():
+    print('Written: %d files, unchanged: %d files, skipped: %d files' % (len(report['written']), len(report['unchanged']), len(report['skipped'])))
+    for filename in report['written']:
+        print('    written: ' + filename)
+
+# returns the content of a file or None if it doesn't exist
+def readFile(filename):
+    if not os.path.exists(filename):
+        return None
+    f = open(filename, 'r')
+    content = f.read()
+    f.close()
+    return content
+
+def hashString(string):
+    if string is None:
+        return None
+    return hashlib.sha1(string).hexdigest()
+
+# the generator's own source is part of every input hash, so that changing it regenerates everything
+def getGeneratorHash():
+    return hashString(readFile(__file__.replace('.pyc', '.py')))
+
+# (only the outside variables used in the module count: the dict also holds whatever the modules before it left there)
+def hashModuleInput(node, name, baseAddress, vars, num_of_oh, station):
+    source = xml.tostring(node)
+    ownVars = set(child.get('generate_idx_var') for child in node.iter())
+    usedVars = sorted((key, value) for key, value in vars.items() if key not in ownVars and '${' + key + '}' in source)
+    return hashString(getGeneratorHash() + repr((name, baseAddress, usedVars, num_of_oh, station)) + source)
+
+def hashModules(modules):
+    return hashString(getGeneratorHash() + repr([module.inputHash for module in modules]))
+
+# hash of the attributes that make up the tree, and of the parameters of the output written from it
+def hashTreeInput(filename, parameters):
+    h = hashlib.sha1(getGeneratorHash())
+    h.update(repr(parameters))
+    def hashNode(node):
+        h.update(repr([node.tag] + [node.get(attribute) for attribute in TREE_HASH_ATTRIBUTES]))
+        for child in node:
+            hashNode(child)
+        h.update('/')
+    hashNode(xml.parse(filename).getroot())
+    return h.hexdigest()
+
+# expands the address table: appends the modules (with their registers) to the modules list, and the nodes to the children of parent
+def findRegisters(node, baseName, baseAddress, modules, currentModule, vars, isGenerated, num_of_oh, station, parent):
 
     if node.get('gem_stations') is not None and station not in node.get('gem_stations'):
         return
@@ -196,10 +413,22 @@ def findRegisters(node, baseName, baseAddress, modules, currentModule, vars, isG
 
         generateAddressStep = parseInt(node.get('generate_address_step'))
         generateIdxVar = node.get('generate_idx_var')
+        # the copies look the same in the tree (relative to their own address) if the index isn't used in any id below them
+        isTemplated = not any('${' + generateIdxVar + '}' in child.get('id', '') for child in node.iter() if child is not node)
+        idParts = node.get('id').split('${' + generateIdxVar + '}', 1) + ['']
+        generate = (substituteVars(idParts[0], vars), substituteVars(idParts[1], vars), generateAddressStep, generateSize)
+        template = None
         for i in range(0, generateSize):
             vars[generateIdxVar] = i
             print('generate base_addr = ' + hex(baseAddress + generateAddressStep * i) + ' for node ' + node.get('id'))
-            findRegisters(node, baseName, baseAddress + generateAddressStep * i, modules, currentModule, vars, True, num_of_oh, station)
+            numChildren = len(parent.children)
+            findRegisters(node, baseName, baseAddress + generateAddressStep * i, modules, currentModule, vars, True, num_of_oh, station, parent)
+            if len(parent.children) > numChildren:
+                parent.children[-1].generate = generate
+                parent.children[-1].index = i
+                if isTemplated:
+                    template = template or parent.children[-1]
+                    parent.children[-1].template = template
         return
 
     isModule = node.get('fw_is_module') is not None and node.get('fw_is_module') == 'true'
@@ -210,6 +439,7 @@ def findRegisters(node, baseName, baseAddress, modules, currentModule, vars, isG
     name += node.get('id')
     name = substituteVars(name, vars)
     address = baseAddress
+    reg = None
 
     if isModule:
         module = Module()
@@ -231,6 +461,10 @@ def findRegisters(node, baseName, baseAddress, modules, currentModule, vars, isG
             error = 'One or more parameters for module ' + module.name + ' is missing... ' + module.toString()
             raise ValueError(error)
         modules.append(module)
+        module.inputHash = hashModuleInput(node, name, baseAddress, vars, num_of_oh, station)
+        if isModuleCached(module):
+            print('Module ' + module.name + ' did not change since the last run, not expanding it')
+            module.isCached = True
     else:
         if node.get('address') is not None:
             address = baseAddress + parseInt(node.get('address'))
@@ -268,11 +502,24 @@ def findRegisters(node, baseName, baseAddress, modules, currentModule, vars, isG
 
             module.addReg(reg)
 
+    # register addresses are relative to their module, the tree has the absolute ones
+    treeNode = Node(name, address if module is None else module.baseAddress + address)
+    treeNode.mask = parseInt(node.get('mask'))
+    treeNode.permission = node.get('permission')
+    treeNode.mode = node.get('mode')
+    treeNode.size = node.get('size')
+    treeNode.reg = reg
+    parent.children.append(treeNode)
+    if isModule:
+        treeNode.module = module
+        if module.isCached:
+            return
+
     for child in node:
-        findRegisters(child, name, address, modules, module, vars, False, num_of_oh, station)
+        findRegisters(child, name, address, modules, module, vars, False, num_of_oh, station, treeNode)
 
 def writeConstantsFile(modules, filename):
-    f = open(filename, 'w')
+    f = OutputFile(filename)
     f.write('library IEEE;\n'\
             'use IEEE.STD_LOGIC_1164.all;\n\n')
     f.write('-----> !! This package is auto-generated from an address table file using <repo_root>/scripts/generate_registers.py !! <-----\n')
@@ -281,56 +528,58 @@ def writeConstantsFile(modules, filename):
     for module in modules:
         if module.isExternal:
             continue
+        f.write(getModuleSection(module, 'constants', writeModuleConstants))
 
-        totalRegs32 = getNumRequiredRegs32(module)
-
-        # check if we have enough address bits for the max reg address (recall that the reg list is sorted by address)
-        topAddressBinary = "{0:#0b}".format(module.regs[-1].address)
-        numAddressBitsNeeded = len(topAddressBinary) - 2
-        print('Top address of the registers is ' + hex(module.regs[-1].address) + ' (' + topAddressBinary + '), need ' + str(numAddressBitsNeeded) + ' bits and have ' + str(module.regAddressMsb - module.regAddressLsb + 1) + ' bits available')
-        if numAddressBitsNeeded > module.regAddressMsb - module.regAddressLsb + 1:
-            raise ValueError('There is not enough bits in the module address space to accomodate all registers (see above for details). Please modify fw_reg_addr_msb and/or fw_reg_addr_lsb attributes in the xml file')
+    f.write('\n')
+    f.write('end registers;\n')
+    f.close()
 
+def writeModuleConstants(module, f):
+    totalRegs32 = getNumRequiredRegs32(module)
 
-        f.write('\n')
-        f.write('    --============================================================================\n')
-        f.write('    --       >>> ' + module.getVhdlName() + ' Module <<<    base address: ' + hexPadded32(module.baseAddress) + '\n')
-        f.write('    --\n')
-        for line in tw.wrap(module.description, 75):
-            f.write('    -- ' + line + '\n')
-        f.write('    --============================================================================\n\n')
-
-        f.write('    constant ' + VHDL_REG_CONSTANT_PREFIX + module.getVhdlName() + '_NUM_REGS : integer := ' + str(totalRegs32) + ';\n')
-        f.write('    constant ' + VHDL_REG_CONSTANT_PREFIX + module.getVhdlName() + '_ADDRESS_MSB : integer := ' + str(module.regAddressMsb) + ';\n')
-        f.write('    constant ' + VHDL_REG_CONSTANT_PREFIX + module.getVhdlName() + '_ADDRESS_LSB : integer := ' + str(module.regAddressLsb) + ';\n')
-        #f.write('    type T_' + VHDL_REG_CONSTANT_PREFIX + module.getVhdlName() + '_ADDRESS_ARR is array(integer range <>) of std_logic_vector(%s downto %s);\n\n' % (VHDL_REG_CONSTANT_PREFIX + module.getVhdlName() + '_ADDRESS_MSB', VHDL_REG_CONSTANT_PREFIX + module.getVhdlName() + '_ADDRESS_LSB')) # cannot use that because we need to be able to pass it as a generic type to the generic IPBus slave module
+    # check if we have enough address bits for the max reg address (recall that the reg list is sorted by address)
+    topAddressBinary = "{0:#0b}".format(module.regs[-1].address)
+    numAddressBitsNeeded = len(topAddressBinary) - 2
+    print('Top address of the registers is ' + hex(module.regs[-1].address) + ' (' + topAddressBinary + '), need ' + str(numAddressBitsNeeded) + ' bits and have ' + str(module.regAddressMsb - module.regAddressLsb + 1) + ' bits available')
+    if numAddressBitsNeeded > module.regAddressMsb - module.regAddressLsb + 1:
+        raise ValueError('There is not enough bits in the module address space to accomodate all registers (see above for details). Please modify fw_reg_addr_msb and/or fw_reg_addr_lsb attributes in the xml file')
 
-        for reg in module.regs:
-            print('Writing register constants for ' + reg.name)
-            f.write('    constant ' + VHDL_REG_CONSTANT_PREFIX + reg.getVhdlName() + '_ADDR    : '\
-                        'std_logic_vector(' + str(module.regAddressMsb) + ' downto ' + str(module.regAddressLsb) + ') := ' + \
-                        vhdlHexPadded(reg.address, module.regAddressMsb - module.regAddressLsb + 1)  + ';\n')
-            if reg.msb == reg.lsb:
-                f.write('    constant ' + VHDL_REG_CONSTANT_PREFIX + reg.getVhdlName() + '_BIT    : '\
-                            'integer := ' + str(reg.msb) + ';\n')
-            else:
-                f.write('    constant ' + VHDL_REG_CONSTANT_PREFIX + reg.getVhdlName() + '_MSB    : '\
-                            'integer := ' + str(reg.msb) + ';\n')
-                f.write('    constant ' + VHDL_REG_CONSTANT_PREFIX + reg.getVhdlName() + '_LSB     : '\
-                            'integer := ' + str(reg.lsb) + ';\n')
-            if reg.default is not None and reg.msb - reg.lsb > 0:
-                f.write('    constant ' + VHDL_REG_CONSTANT_PREFIX + reg.getVhdlName() + '_DEFAULT : '\
-                            'std_logic_vector(' + str(reg.msb) + ' downto ' + str(reg.lsb) + ') := ' + \
-                            vhdlHexPadded(reg.default, reg.msb - reg.lsb + 1)  + ';\n')
-            elif reg.default is not None and reg.msb - reg.lsb == 0:
-                f.write('    constant ' + VHDL_REG_CONSTANT_PREFIX + reg.getVhdlName() + '_DEFAULT : '\
-                            'std_logic := ' + \
-                            vhdlHexPadded(reg.default, reg.msb - reg.lsb + 1)  + ';\n')
-            f.write('\n')
 
     f.write('\n')
-    f.write('end registers;\n')
-    f.close()
+    f.write('    --============================================================================\n')
+    f.write('    --       >>> ' + module.getVhdlName() + ' Module <<<    base address: ' + hexPadded32(module.baseAddress) + '\n')
+    f.write('    --\n')
+    for line in tw.wrap(module.description, 75):
+        f.write('    -- ' + line + '\n')
+    f.write('    --============================================================================\n\n')
+
+    f.write('    constant ' + VHDL_REG_CONSTANT_PREFIX + module.getVhdlName() + '_NUM_REGS : integer := ' + str(totalRegs32) + ';\n')
+    f.write('    constant ' + VHDL_REG_CONSTANT_PREFIX + module.getVhdlName() + '_ADDRESS_MSB : integer := ' + str(module.regAddressMsb) + ';\n')
+    f.write('    constant ' + VHDL_REG_CONSTANT_PREFIX + module.getVhdlName() + '_ADDRESS_LSB : integer := ' + str(module.regAddressLsb) + ';\n')
+    #f.write('    type T_' + VHDL_REG_CONSTANT_PREFIX + module.getVhdlName() + '_ADDRESS_ARR is array(integer range <>) of std_logic_vector(%s downto %s);\n\n' % (VHDL_REG_CONSTANT_PREFIX + module.getVhdlName() + '_ADDRESS_MSB', VHDL_REG_CONSTANT_PREFIX + module.getVhdlName() + '_ADDRESS_LSB')) # cannot use that because we need to be able to pass it as a generic type to the generic IPBus slave module
+
+    for reg in module.regs:
+        print('Writing register constants for ' + reg.name)
+        f.write('    constant ' + VHDL_REG_CONSTANT_PREFIX + reg.getVhdlName() + '_ADDR    : '\
+                    'std_logic_vector(' + str(module.regAddressMsb) + ' downto ' + str(module.regAddressLsb) + ') := ' + \
+                    vhdlHexPadded(reg.address, module.regAddressMsb - module.regAddressLsb + 1)  + ';\n')
+        if reg.msb == reg.lsb:
+            f.write('    constant ' + VHDL_REG_CONSTANT_PREFIX + reg.getVhdlName() + '_BIT    : '\
+                        'integer := ' + str(reg.msb) + ';\n')
+        else:
+            f.write('    constant ' + VHDL_REG_CONSTANT_PREFIX + reg.getVhdlName() + '_MSB    : '\
+                        'integer := ' + str(reg.msb) + ';\n')
+            f.write('    constant ' + VHDL_REG_CONSTANT_PREFIX + reg.getVhdlName() + '_LSB     : '\
+                        'integer := ' + str(reg.lsb) + ';\n')
+        if reg.default is not None and reg.msb - reg.lsb > 0:
+            f.write('    constant ' + VHDL_REG_CONSTANT_PREFIX + reg.getVhdlName() + '_DEFAULT : '\
+                        'std_logic_vector(' + str(reg.msb) + ' downto ' + str(reg.lsb) + ') := ' + \
+                        vhdlHexPadded(reg.default, reg.msb - reg.lsb + 1)  + ';\n')
+        elif reg.default is not None and reg.msb - reg.lsb == 0:
+            f.write('    constant ' + VHDL_REG_CONSTANT_PREFIX + reg.getVhdlName() + '_DEFAULT : '\
+                        'std_logic := ' + \
+                        vhdlHexPadded(reg.default, reg.msb - reg.lsb + 1)  + ';\n')
+        f.write('\n')
 
 def updateModuleFile(module):
     if module.isExternal:
@@ -342,7 +591,7 @@ def updateModuleFile(module):
     lines = f.readlines()
     f.close()
 
-    f = open(module.file, 'w')
+    f = OutputFile(module.file)
     signalSectionFound = False
     signalSectionDone = False
     slaveSectionFound = False
@@ -547,90 +796,135 @@ def updateModuleFile(module):
     if duplicateReadReadyError:
         raise ValueError("Two or more read ready signals in module %s are associated with the same register address (only one read ready signal per reg address is allowed), more details are printed to the module file" % module.file)
 
-# prints out bash scripts for quick and dirty testing in CTP7 linux (TODO: compile and install python there and write a nice command line interface which would use the address table (something like acm13tool with reg names autocomplete would be cool)
-def writeStatusBashScript(modules, filename):
-    print('Writing CTP7 status bash script')
+# writes the readable registers of every module for ctp7_status.py, which reads each module with a few block reads.
+# One JSON object per line and module, so that the dumper only has to decode the modules it shows:
+#   {"name": module name, "address": AXI address of the module, "regs": [[name below the module, word offset, mask, lsb], ...]}
+def writeStatusLayout(modules, filename):
+    print('Writing CTP7 status layout')
 
-    f = open(filename, 'w')
-
-    f.write('#!/bin/sh\n\n')
-    f.write('MODULE=$1\n')
-
-    f.write('if [ -z "$MODULE" ]; then\n')
-    f.write('    echo "Usage: this_script.sh <module_name>"\n')
-    f.write('    echo "Available modules:"\n')
+    f = OutputFile(filename)
     for module in modules:
-        f.write('    echo "%s"' % module.name.replace(TOP_NODE_NAME + '.', ''))
-    f.write('    exit\n')
-    f.write('fi\n\n')
+        f.write(getModuleSection(module, 'layout', writeModuleLayout))
+    f.close()
 
-    for module in modules:
-        f.write('if [ "$MODULE" = "%s" ]; then\n' % module.name.replace(TOP_NODE_NAME + '.', ''))
-        for reg in module.regs:
-            if 'r' in reg.permission:
-                if reg.mask == 0xffffffff:
-                    f.write("    printf '" + reg.name.ljust(45) + " = 0x%x\\n' `mpeek " + hex(AXI_IPB_BASE_ADDRESS + ((module.baseAddress + reg.address) << 2)) + "` \n")
-                else:
-                    f.write("    printf '" + reg.name.ljust(45) + " = 0x%x\\n' $(( (`mpeek " + hex(AXI_IPB_BASE_ADDRESS + ((module.baseAddress + reg.address) << 2)) + "` & " + hexPadded32(reg.mask) + ") >> " + str(reg.lsb) + " ))\n")
-        f.write('fi\n\n')
+def writeModuleLayout(module, f):
+    regs = [[reg.name[len(module.name) + 1:], reg.address, reg.mask, reg.lsb] for reg in module.regs if 'r' in reg.permission]
+    # (the name goes first, which lets the dumper skip a line without decoding it)
+    f.write('{"name":%s,"address":%d,"regs":%s}\n' % (json.dumps(module.name), AXI_IPB_BASE_ADDRESS + (module.baseAddress << 2), json.dumps(regs, separators=(',', ':'))))
 
-    f.close()
+UHAL_PROCESSES = multiprocessing.cpu_count() # the AMC file and the per link files are written in parallel
+UHAL_MODULE_MIN_LINES = 16 # with --uhal-modules, repeated subtrees taking at least this many lines go to module files
 
-def writeUHalAddressTable(modules, filename, addrOffset, num_of_oh = None):
-    print('Writing uHAL address table XML')
+uhalModules = False
+uhalTop = None # the tree the uHAL files are written from, a global so that the pool processes get it when they are forked
+uhalFilename = None
 
-    rw_reg.parseXML(ADDRESS_TABLE_TOP, num_of_oh)
-    top = rw_reg.getNode('GEM_AMC')
+# top is the GEM_AMC node of the tree built by findRegisters
+def writeUHalAddressTable(top, filename, addrOffset, num_of_oh = None):
+    print('Writing uHAL address table XML')
 
-    # AMC specific nodes
-    f = open("%s_amc.xml"%(filename), 'w')
+    global uhalTop, uhalFilename
+    uhalTop = top
+    uhalFilename = filename
+
+    files = getUHalFiles(filename, addrOffset, num_of_oh)
+    if UHAL_PROCESSES > 1:
+        pool = multiprocessing.Pool(min(UHAL_PROCESSES, len(files)))
+        try:
+            results = pool.map(writeUHalFile, files)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = map(writeUHalFile, files)
+
+    moduleFiles = {}
+    for filename, written, contentHash, fileModules in results:
+        recordOutput(filename, written, contentHash)
+        for moduleFilename, content in fileModules.items():
+            if moduleFiles.setdefault(moduleFilename, content) != content:
+                raise ValueError('Two different subtrees would be written to the uHAL module file %s' % moduleFilename)
+
+    for moduleFilename in sorted(moduleFiles.keys()):
+        content = moduleFiles[moduleFilename]
+        recordOutput(moduleFilename, writeIfChanged(moduleFilename, content), hashString(content))
+
+# the AMC specific nodes (link None) and the OH specific nodes of each link, as (filename, addrOffset, link)
+def getUHalFiles(filename, addrOffset, num_of_oh):
+    return [("%s_amc.xml"%(filename), addrOffset, None)] + [("%s_link%02d.xml"%(filename,oh), addrOffset, oh) for oh in range(num_of_oh)]
+
+# the name of the module sections that make up a uHAL file
+def getUHalSection(filename):
+    return 'uhal%s.%s' % ('_modules' if uhalModules else '', os.path.basename(filename))
+
+# writes one uHAL file (runs in a pool process, so it returns what has to be recorded about the output instead of recording it)
+# and returns the content of the module files it refers to, which are written once by the caller
+def writeUHalFile(args):
+    filename, addrOffset, link = args
+    moduleFiles = {} if uhalModules else None
+    f = StringIO.StringIO()
     f.write('<?xml version="1.0" encoding="ISO-8859-1"?>\n')
     f.write('<node id="top">\n')
-    printNodeToUHALFile(top, f, 1, 0, None, addrOffset)
+    printNodeToUHALFile(uhalTop, f, 1, 0, None, addrOffset, link, {}, moduleFiles, getUHalSection(filename))
     f.write('</node>\n')
-    f.close()
-
-    # OH specific nodes
-    for oh in range(num_of_oh):
-        f = open("%s_link%02d.xml"%(filename,oh), 'w')
-        f.write('<?xml version="1.0" encoding="ISO-8859-1"?>\n')
-        f.write('<node id="top">\n')
-        printNodeToUHALFile(top, f, 1, 0, None, addrOffset, oh)
-        f.write('</node>\n')
-        f.close()
-        pass
-    pass
-
-def printNodeToUHALFile(node, file, level, baseAddress, baseName, addrOffset, num_of_oh=None):
-    amcTopNodesToSkip = ["GEM_AMC.OH"]
-
-    ohTopNodesToSkip = [
-        "GEM_AMC.TTC",
-        "GEM_AMC.TRIGGER.CTRL",
-        "GEM_AMC.TRIGGER.STATUS",
-        "GEM_AMC.GEM_SYSTEM",
-        "GEM_AMC.GEM_TESTS",
-        "GEM_AMC.DAQ",
-        "GEM_AMC.OH_LINKS.CTRL",
-        "GEM_AMC.SLOW_CONTROL",
-        "GEM_AMC.GLIB_SYSTEM",
-        ]
+    content = f.getvalue()
+    return filename, writeIfChanged(filename, content), hashString(content), moduleFiles or {}
+
+# e.g. ./address_table/uhal_gem_amc_ctp7_module_oh_oh_geb_vfat.xml for GEM_AMC.OH.OH${OH_IDX}.GEB.VFAT${VFAT_IDX}
+# (named after the first copy without the indices, the copies of all the OHs share it)
+def getUHalModuleFilename(template):
+    segments = template.name.replace(TOP_NODE_NAME + '.', '').lower().split('.')
+    return '%s_module_%s.xml' % (uhalFilename, '_'.join(segment.rstrip('0123456789').rstrip('_') for segment in segments))
+
+AMC_TOP_NODES_TO_SKIP = ["GEM_AMC.OH"]
+
+OH_TOP_NODES_TO_SKIP = [
+    "GEM_AMC.TTC",
+    "GEM_AMC.TRIGGER.CTRL",
+    "GEM_AMC.TRIGGER.STATUS",
+    "GEM_AMC.GEM_SYSTEM",
+    "GEM_AMC.GEM_TESTS",
+    "GEM_AMC.DAQ",
+    "GEM_AMC.OH_LINKS.CTRL",
+    "GEM_AMC.SLOW_CONTROL",
+    "GEM_AMC.GLIB_SYSTEM",
+    ]
+
+OTHER_OH_NODES = dict((oh, set("OH%d"%(other) for other in range(0,12) if other != oh)) for oh in range(0,12))
+
+# renderedChildren holds the children of the template nodes already written to this file, which are the same for all
+# the copies generated from them
+# if moduleFiles is given, copies with big enough subtrees refer to a module file instead (added to moduleFiles: filename -> content)
+# if section is given, the modules are written as the module sections of that name (with the module files they refer to)
+def printNodeToUHALFile(node, file, level, baseAddress, baseName, addrOffset, num_of_oh=None, renderedChildren=None, moduleFiles=None, section=None):
+    if node.module is not None and section is not None:
+        def render(module, f):
+            content = StringIO.StringIO()
+            sectionModuleFiles = {} if moduleFiles is not None else None
+            printNodeToUHALFile(node, content, level, baseAddress, baseName, addrOffset, num_of_oh, renderedChildren, sectionModuleFiles)
+            json.dump([content.getvalue(), sectionModuleFiles], f)
+        content, sectionModuleFiles = json.loads(getModuleSection(node.module, section, render))
+        file.write(str(content))
+        if moduleFiles is not None:
+            for moduleFilename, moduleContent in sectionModuleFiles.items():
+                moduleFiles.setdefault(str(moduleFilename), str(moduleContent))
+        return
 
     name = node.name
     if baseName is not None:
         name = name.replace(baseName + ".", "")
 
-    if (num_of_oh == None and "%s.%s"%(baseName,name) in amcTopNodesToSkip):
+    if (num_of_oh == None and "%s.%s"%(baseName,name) in AMC_TOP_NODES_TO_SKIP):
         # only for writing the AMC specific file
         print 'Not writing node "%s" to AMC uHAL address table file'%(name)
         return
 
-    if num_of_oh in range(0,12):
+    if num_of_oh in OTHER_OH_NODES:
         # only for writing the OH specific file
-        if "%s.%s"%(baseName,name) in ohTopNodesToSkip:
+        if "%s.%s"%(baseName,name) in OH_TOP_NODES_TO_SKIP:
             print 'Not writing node "%s" to OH uHAL address table file'%(name)
             return
-        if name in ["OH%d"%(oh) for oh in range(0,12) if oh != num_of_oh]:
+        if name in OTHER_OH_NODES[num_of_oh]:
             print 'Not writing node "%s" to OH%d uHAL address table file'%(name,num_of_oh)
             return
     for i in range(level):
@@ -653,15 +947,278 @@ def printNodeToUHALFile(node, file, level, baseAddress, baseName, addrOffset, nu
         file.write('size="%s" ' % node.size)
 
     if len(node.children) > 0:
-        file.write('>\n')
-        for child in node.children:
-            printNodeToUHALFile(child, file, level + 1, node.address, node.name, addrOffset, num_of_oh)
+        if node.template is not None and renderedChildren is not None:
+            children = renderedChildren.get(node.template)
+            if children is None:
+                children = StringIO.StringIO()
+                for child in node.template.children:
+                    printNodeToUHALFile(child, children, level + 1, node.template.address, node.template.name, addrOffset, num_of_oh, renderedChildren, moduleFiles)
+                children = renderedChildren[node.template] = children.getvalue()
+            if moduleFiles is not None and children.count('\n') >= UHAL_MODULE_MIN_LINES:
+                moduleFilename = getUHalModuleFilename(node.template)
+                if moduleFilename not in moduleFiles:
+                    # the module file has the children one level below its top node
+                    moduleFiles[moduleFilename] = '<?xml version="1.0" encoding="ISO-8859-1"?>\n<node id="top">\n' +\
+                                                  ''.join(line[2 * level:] for line in children.splitlines(True)) + '</node>\n'
+                file.write('module="file://%s" />\n' % os.path.basename(moduleFilename))
+                return
+            file.write('>\n')
+            file.write(children)
+        else:
+            file.write('>\n')
+            for child in node.children:
+                printNodeToUHALFile(child, file, level + 1, node.address, node.name, addrOffset, num_of_oh, renderedChildren, moduleFiles, section)
         for i in range(level):
             file.write('  ')
         file.write('</node>\n')
     else:
         file.write('/>\n')
 
+########## Python accessors ##########
+#
+# The accessor module has one class per kind of node in the tree, whose class attributes are the nodes and registers
+# below it with their offsets, masks and permissions, so that e.g. gem.oh[3].geb.vfat[7].cfg_latency is resolved with a
+# few additions instead of a name lookup, and importing it replaces parsing the address table.
+# The copies of a generate node are an indexed attribute: the address of a copy is computed from the generate step, and
+# copies with the same subtree (see Node.template) share one class, so the module is about the size of one OH.
+
+PYTHON_RESERVED_NAMES = ['name', 'real_address', 'mask', 'shift', 'permission', 'read', 'write']
+
+PYTHON_ACCESSOR_HEADER = """# -----> !! This module is auto-generated from an address table file using <repo_root>/scripts/generate_registers.py !! <-----
+#
+# Register accessors with precomputed addresses, e.g.:
+#   from gem_amc_regs import gem
+#   gem.oh[3].geb.vfat[7].cfg_latency.write(45)
+#   print gem.oh[3].geb.vfat[7].cfg_latency.read()
+# Nodes and registers have name, real_address, mask, shift and permission like rw_reg nodes, and can be given to the
+# rw_reg functions that take nodes (readValues, ReadPlan, WriteTransaction...).
+# Names that are Python keywords or clash with these attributes get a trailing underscore (e.g. channel[0].mask_).
+
+from rw_reg import readValue, writeValue
+
+# the nodes below a node are made the first time they are used and kept in _nodes (attribute -> node)
+class Node(object):
+    __slots__ = ('name', 'real_address', '_nodes')
+    mask = None
+    shift = 0
+    permission = None
+
+    def __init__(self, name, real_address):
+        self.name = name
+        self.real_address = real_address
+        self._nodes = {}
+
+    def read(self):
+        return readValue(self)
+
+    def write(self, value):
+        return writeValue(self, value)
+
+    def __eq__(self, other):
+        return isinstance(other, Node) and other.name == self.name
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __hash__(self):
+        return hash(self.name)
+
+    def __repr__(self):
+        return '<%s %s>' % (type(self).__name__, self.name)
+
+# a node whose only content are the copies of a generate node can be indexed directly, e.g. gem.oh[3] for gem.oh.oh[3]
+class Indexed(Node):
+    __slots__ = ()
+    copies = None
+
+    def __getitem__(self, index):
+        return getattr(self, self.copies)[index]
+
+    def __len__(self):
+        return len(getattr(self, self.copies))
+
+    def __iter__(self):
+        return iter(getattr(self, self.copies))
+
+class Register(Node):
+    __slots__ = ('mask', 'shift', 'permission')
+
+    def __init__(self, name, real_address, mask, shift, permission):
+        Node.__init__(self, name, real_address)
+        self.mask = mask
+        self.shift = shift
+        self.permission = permission
+
+# a register without anything below it, offset is in bytes from the node
+class Field(object):
+
+    def __init__(self, id, offset, mask, shift, permission):
+        self.id = id
+        self.offset = offset
+        self.mask = mask
+        self.shift = shift
+        self.permission = permission
+
+    def __get__(self, node, cls):
+        if node is None:
+            return self
+        reg = node._nodes.get(self)
+        if reg is None:
+            reg = node._nodes[self] = Register(node.name + '.' + self.id, node.real_address + self.offset, self.mask, self.shift, self.permission)
+        return reg
+
+# a node with more nodes below it
+class Child(object):
+
+    def __init__(self, cls, id, offset):
+        self.cls = cls
+        self.id = id
+        self.offset = offset
+
+    def __get__(self, node, cls):
+        if node is None:
+            return self
+        child = node._nodes.get(self)
+        if child is None:
+            child = node._nodes[self] = self.cls(node.name + '.' + self.id, node.real_address + self.offset)
+        return child
+
+# the copies of a generate node, the id of copy i is prefix + i + suffix
+# (classes has one class for all the copies, or one per copy if their subtrees differ)
+class Array(object):
+
+    def __init__(self, classes, prefix, suffix, offset, step, size):
+        self.classes = classes
+        self.prefix = prefix
+        self.suffix = suffix
+        self.offset = offset
+        self.step = step
+        self.size = size
+
+    def __get__(self, node, cls):
+        if node is None:
+            return self
+        copies = node._nodes.get(self)
+        if copies is None:
+            copies = node._nodes[self] = Copies(self, node)
+        return copies
+
+class Copies(object):
+    __slots__ = ('array', 'node', 'copies')
+
+    def __init__(self, array, node):
+        self.array = array
+        self.node = node
+        self.copies = [None] * array.size
+
+    def __getitem__(self, index):
+        array = self.array
+        if index < 0 or index >= array.size:
+            raise IndexError('%s.%sN%s has copies 0 to %d, not %d' % (self.node.name, array.prefix, array.suffix, array.size - 1, index))
+        copy = self.copies[index]
+        if copy is None:
+            cls = array.classes[index if len(array.classes) > 1 else 0]
+            copy = self.copies[index] = cls('%s.%s%d%s' % (self.node.name, array.prefix, index, array.suffix), self.node.real_address + array.offset + index * array.step)
+        return copy
+
+    def __len__(self):
+        return self.array.size
+
+    def __iter__(self):
+        return (self[index] for index in xrange(self.array.size))
+"""
+
+# top is the GEM_AMC node of the tree built by findRegisters, baseAddress the address of the register space on the bus
+def writePythonAccessors(top, filename, baseAddress):
+    print('Writing Python register accessors to ' + filename)
+    classes = []
+    topClass = writeAccessorClass(top, top.name, classes)
+
+    f = OutputFile(filename)
+    f.write(PYTHON_ACCESSOR_HEADER)
+    for lines in classes:
+        f.write('\n' + lines)
+    f.write('\n%s = %s(%r, %s)\n' % (PYTHON_ACCESSOR_TOP_NAME, topClass, top.name, hex(baseAddress + (top.address << 2))))
+    f.close()
+
+# appends the source of the class for this node (after the ones of the nodes below it, which it refers to) and returns its name
+# (the classes of a module are one module section, unless useSections is false)
+def writeAccessorClass(node, className, classes, useSections = True):
+    if node.module is not None and useSections:
+        def render(module, f):
+            moduleClasses = []
+            writeAccessorClass(node, className, moduleClasses, False)
+            f.write('\n'.join(moduleClasses))
+        classes.append(getModuleSection(node.module, 'accessors', render))
+        return className
+
+    attributes = []
+    names = set()
+    children = node.children
+    i = 0
+    while i < len(children):
+        child = children[i]
+        offset = hex((child.address - node.address) << 2)
+        if child.generate is not None:
+            copies = [copy for copy in children[i:i + child.generate[3]] if copy.generate is child.generate]
+            i += len(copies)
+            prefix, suffix, step, size = child.generate
+            if not hasChildren(child) and child.permission is None:
+                continue
+            name = getAccessorName(prefix + suffix, names, node)
+            if name is None:
+                continue
+            if child.template is not None:
+                copyClasses = [writeAccessorClass(child, className + '_' + name.upper(), classes)]
+            else:
+                copyClasses = [writeAccessorClass(copy, className + '_' + re.sub('[^A-Z0-9_]', '_', getRelativeId(copy, node).upper()), classes) for copy in copies]
+            attributes.append('%s = Array((%s,), %r, %r, %s, %s, %d)' % (name, ', '.join(copyClasses), prefix, suffix, offset, hex(step << 2), len(copies)))
+        else:
+            i += 1
+            id = getRelativeId(child, node)
+            name = getAccessorName(id, names, node) if hasChildren(child) or child.permission is not None else None
+            if name is None:
+                continue
+            if hasChildren(child):
+                attributes.append('%s = Child(%s, %r, %s)' % (name, writeAccessorClass(child, className + '_' + name.upper(), classes), id, offset))
+            else:
+                msb, lsb = getLowHighFromBitmask(0xffffffff if child.mask is None else child.mask)
+                attributes.append('%s = Field(%r, %s, %s, %d, %r)' % (name, id, offset, hex(child.mask), lsb, child.permission))
+
+    if len(attributes) == 1 and ' = Array(' in attributes[0] and node.permission is None:
+        lines = ['class %s(Indexed):' % className, '    copies = %r' % attributes[0].split(' ')[0]]
+    else:
+        lines = ['class %s(Node):' % className]
+    if node.permission is not None:
+        msb, lsb = getLowHighFromBitmask(0xffffffff if node.mask is None else node.mask)
+        lines += ['    mask = %s' % hex(node.mask), '    shift = %d' % lsb, '    permission = %r' % node.permission]
+    lines += ['    ' + attribute for attribute in attributes]
+    if len(lines) == 1:
+        lines.append('    pass')
+    classes.append('\n'.join(lines) + '\n')
+    return className
+
+# (the top node of a module that wasn't expanded has no children in the tree, but modules always have registers)
+def hasChildren(node):
+    return len(node.children) > 0 or (node.module is not None and node.module.isCached)
+
+def getRelativeId(node, parent):
+    return node.name[len(parent.name) + 1:]
+
+# e.g. CFG_LATENCY -> cfg_latency, CLUSTER_SIZE_${CS_IDX}_CNT -> cluster_size_cnt (given as prefix + suffix), None if a
+# sibling already has this name
+def getAccessorName(id, names, parent):
+    name = re.sub('[^a-z0-9]+', '_', id.lower()).strip('_')
+    if name == '' or name[0].isdigit():
+        name = '_' + name
+    if keyword.iskeyword(name) or name in PYTHON_RESERVED_NAMES:
+        name += '_'
+    if name in names:
+        print('WARNING: more than one node below %s has the Python accessor name %s, only the first one is accessible' % (parent.name, name))
+        return None
+    names.add(name)
+    return name
+
 # prints out bash script to read registers matching an expression
 def writeRegReadBashScript(modules, filename):
     print('Writing CTP7 reg read bash script')
@@ -763,24 +1320,17 @@ def parseInt(string):
         return int(string)
 
 def getLowHighFromBitmask(bitmask):
-    binary32 = binaryPadded32(bitmask)
-    lsb = -1
-    msb = -1
-    rangeDone = False
-    for i in range(1, 33):
-        if binary32[i * -1] == '1':
-            if rangeDone == True:
-                raise ValueError('Non-continuous bitmasks are not supported: %s' % hexPadded32(bitmask))
-            if lsb == -1:
-                lsb = i - 1
-            msb = i - 1
-        if lsb != -1 and binary32[i * -1] == '0':
-            if rangeDone == False:
-                rangeDone = True
+    bitmask &= 0xffffffff
+    if bitmask == 0:
+        return -1, -1
+    lsb = (bitmask & -bitmask).bit_length() - 1
+    msb = bitmask.bit_length() - 1
+    if (bitmask >> lsb) + 1 != 1 << (msb - lsb + 1):
+        raise ValueError('Non-continuous bitmasks are not supported: %s' % hexPadded32(bitmask))
     return msb, lsb
 
 def substituteVars(string, vars):
-    if string is None:
+    if string is None or '${' not in string:
         return string
     ret = string
     for varKey in vars.keys():
@@ -84,8 +84,8 @@ if __name__ == '__main__':
         writeReg(getNode("GEM_AMC.TTC.CTRL.L1A_ENABLE"), 0)
         l1aCnt = rReg(addrL1aCnt)
 
-        hitCnt = int(readReg(getNode("GEM_AMC.GEM_TESTS.VFAT_DAQ_MONITOR.VFAT%i.CHANNEL_FIRE_COUNT" % vfat)), 0)
-        evtCnt = int(readReg(getNode("GEM_AMC.GEM_TESTS.VFAT_DAQ_MONITOR.VFAT%i.GOOD_EVENTS_COUNT" % vfat)), 0)
+        hitCnt = readValue(getNode("GEM_AMC.GEM_TESTS.VFAT_DAQ_MONITOR.VFAT%i.CHANNEL_FIRE_COUNT" % vfat))
+        evtCnt = readValue(getNode("GEM_AMC.GEM_TESTS.VFAT_DAQ_MONITOR.VFAT%i.GOOD_EVENTS_COUNT" % vfat))
 
         if (evtCnt != l1aCnt):
             printRed("Good event count is not equal to L1A count!!! Good evt cnt = %i, l1a cnt = %i" %(evtCnt, l1aCnt))
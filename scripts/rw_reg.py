@@ -1,28 +1,306 @@
 import xml.etree.ElementTree as xml
 import sys, os, subprocess
+import mmap, ctypes
+import array, struct, hashlib, json, bisect
+import time, atexit, threading, Queue
+import re, fnmatch
 
 DEBUG = True
 ADDRESS_TABLE_TOP = '/mnt/persistent/texas/gem_amc_top.xml'
-nodes = []
-
-class Node:
-    name = ''
-    vhdlname = ''
-    address = 0x0
-    real_address = 0x0
-    permission = ''  
-    mask = 0x0
-    isModule = False
-    parent = None
-    level = 0
-    mode = None
-    size = None
+AXI_BASE_ADDRESS = 0x64000000
+AXI_WINDOW_SIZE = 0x08000000
+DEV_MEM = '/dev/mem'
+ADDRESS_TABLE_CACHE_DIR = None # None means next to the XML file
+ADDRESS_TABLE_CACHE_VERSION = 3
+# the compiled table is published here for all processes to share (see parseXML), None disables this
+# on by default only on the CTP7 (recognized by its address table directory), elsewhere RW_REG_SHARED_DIR=/dev/shm opts in
+# (and RW_REG_SHARED_DIR= opts out on the board)
+ADDRESS_TABLE_SHARED_DIR = os.environ.get('RW_REG_SHARED_DIR', '/dev/shm' if os.path.isdir(os.path.dirname(ADDRESS_TABLE_TOP)) else None) or None
+
+FLAG_READ       = 0x01
+FLAG_WRITE      = 0x02
+FLAG_PERMISSION = 0x04
+FLAG_MODULE     = 0x08
+FLAG_MASK       = 0x10
+
+PERMISSIONS = {0: None, FLAG_PERMISSION: '', FLAG_PERMISSION | FLAG_READ: 'r', FLAG_PERMISSION | FLAG_WRITE: 'w', FLAG_PERMISSION | FLAG_READ | FLAG_WRITE: 'rw'}
+
+# Struct-of-arrays storage for the expanded address table: one entry per node in DFS order, so the subtree of node i is [i, end[i])
+# Names are not stored, only an id of the interned name segment (e.g. "VFAT7") -- full names are rebuilt from the parent chain
+# Children of node i (sorted by segment id for lookups) are childList[childOffset[i+1] : childOffset[i+2]], with the top nodes at index -1
+# byAddress holds the node indices sorted by address (DFS order within the same address)
+class NodeTable:
 
     def __init__(self):
-        self.children = []
+        self.clear()
+
+    def clear(self):
+        self.segs = []
+        self.segIndex = {}
+        self.seg = array.array('I')
+        self.parent = array.array('i')
+        self.end = array.array('I')
+        self.level = array.array('B')
+        self.address = array.array('I')
+        self.mask = array.array('I')
+        self.flags = array.array('B')
+        self.extras = {} # sparse (mode, size, warn_min_value, error_min_value) of block and monitored nodes
+        self.childOffset = array.array('I')
+        self.childList = array.array('I')
+        self.byAddress = array.array('I')
+        self.sharedMemory = None # mapped cache file the arrays point into, if loaded shared
+        self.bySeg = None # segment id -> indices of all nodes with that name segment, built on first use
+
+    def __len__(self):
+        return len(self.seg)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [Node(self, j) for j in xrange(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if i < 0 or i >= len(self):
+            raise IndexError('node index out of range')
+        return Node(self, i)
+
+    def __iter__(self):
+        for i in xrange(len(self)):
+            yield Node(self, i)
+
+    def internSeg(self, seg):
+        segId = self.segIndex.get(seg)
+        if segId is None:
+            segId = len(self.segs)
+            self.segs.append(seg)
+            self.segIndex[seg] = segId
+        return segId
+
+    # adds a node below the given parent index (-1 for a top node) and returns its index -- call close() once all its children are added
+    def append(self, seg, parent, address, mask, permission, isModule, mode = None, size = None, warnMin = None, errorMin = None):
+        idx = len(self.seg)
+        flags = 0
+        if permission is not None:
+            flags |= FLAG_PERMISSION
+            if 'r' in permission: flags |= FLAG_READ
+            if 'w' in permission: flags |= FLAG_WRITE
+        if isModule: flags |= FLAG_MODULE
+        if mask is not None: flags |= FLAG_MASK
+        self.seg.append(self.internSeg(seg))
+        self.parent.append(parent)
+        self.end.append(idx + 1)
+        self.level.append(0 if parent < 0 else self.level[parent] + 1)
+        self.address.append(address)
+        self.mask.append(mask or 0)
+        self.flags.append(flags)
+        if mode is not None or size is not None or warnMin is not None or errorMin is not None:
+            self.extras[idx] = (mode, size, warnMin, errorMin)
+        return idx
+
+    def close(self, idx):
+        self.end[idx] = len(self.seg)
+
+    # builds the child lookup ranges and the address ordering once the tree is complete
+    def finalize(self):
+        n = len(self.seg)
+        counts = [0] * (n + 1)
+        for p in self.parent:
+            counts[p + 1] += 1
+        offsets = [0] * (n + 2)
+        for i in xrange(n + 1):
+            offsets[i + 1] = offsets[i] + counts[i]
+        fill = offsets[:-1]
+        childList = [0] * n
+        for i, p in enumerate(self.parent):
+            childList[fill[p + 1]] = i
+            fill[p + 1] += 1
+        seg = self.seg
+        for i in xrange(n + 1):
+            if offsets[i + 1] - offsets[i] > 1:
+                childList[offsets[i]:offsets[i + 1]] = sorted(childList[offsets[i]:offsets[i + 1]], key=seg.__getitem__)
+        self.childOffset = array.array('I', offsets)
+        self.childList = array.array('I', childList)
+        self.byAddress = array.array('I', sorted(xrange(n), key=self.address.__getitem__))
+
+    def getName(self, idx):
+        segs, seg, parent = self.segs, self.seg, self.parent
+        parts = []
+        while idx >= 0:
+            parts.append(segs[seg[idx]])
+            idx = parent[idx]
+        parts.reverse()
+        return '.'.join(parts)
+
+    # direct children in address table order
+    def getChildren(self, idx):
+        children = []
+        child = idx + 1
+        end = self.end[idx]
+        while child < end:
+            children.append(child)
+            child = self.end[child]
+        return children
+
+    def getTopNodes(self):
+        return sorted(self.childList[self.childOffset[0]:self.childOffset[1]])
+
+    def findChild(self, parent, segId):
+        childList, seg = self.childList, self.seg
+        lo = self.childOffset[parent + 1]
+        hi = end = self.childOffset[parent + 2]
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if seg[childList[mid]] < segId: lo = mid + 1
+            else: hi = mid
+        if lo < end and seg[childList[lo]] == segId:
+            return childList[lo]
+        return None
+
+    # returns the index of the child of parent (-1 for the top nodes) with this name segment, or None
+    def findChildByName(self, parent, name):
+        segId = self.segIndex.get(name)
+        if segId is None:
+            return None
+        return self.findChild(parent, segId)
+
+    # resolves a full dotted name with one binary search per level, returns the node index or None
+    def find(self, name):
+        idx = -1
+        for part in name.split('.'):
+            idx = self.findChildByName(idx, part)
+            if idx is None:
+                return None
+        return idx
+
+    # all nodes below this one (the whole table for -1) in DFS order
+    def getDescendants(self, idx):
+        if idx < 0:
+            return xrange(len(self.seg))
+        return xrange(idx + 1, self.end[idx])
+
+    # all nodes below this one (the whole table for -1) with this name segment, in DFS order
+    def findDescendantsByName(self, idx, name):
+        segId = self.segIndex.get(name)
+        if segId is None:
+            return []
+        if self.bySeg is None:
+            self.bySeg = {}
+            for i, nodeSeg in enumerate(self.seg):
+                self.bySeg.setdefault(nodeSeg, []).append(i)
+        found = self.bySeg.get(segId, [])
+        if idx < 0:
+            return found
+        return found[bisect.bisect_right(found, idx) : bisect.bisect_left(found, self.end[idx])]
+
+    # returns the indices of all nodes at this real (AXI) address
+    def findAddress(self, real_address):
+        if (real_address - AXI_BASE_ADDRESS) & 0x3:
+            return []
+        address = (real_address - AXI_BASE_ADDRESS) >> 2
+        byAddress, addresses = self.byAddress, self.address
+        lo, hi = 0, len(byAddress)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if addresses[byAddress[mid]] < address: lo = mid + 1
+            else: hi = mid
+        matches = []
+        while lo < len(byAddress) and addresses[byAddress[lo]] == address:
+            matches.append(byAddress[lo])
+            lo += 1
+        return matches
+
+    # yields (index, full name) of every node in DFS order without storing the names
+    def iterNames(self):
+        segs, seg, parent = self.segs, self.seg, self.parent
+        names = []
+        for i in xrange(len(seg)):
+            level = self.level[i]
+            del names[level:]
+            names.append(segs[seg[i]] if level == 0 else names[level - 1] + '.' + segs[seg[i]])
+            yield i, names[level]
+
+NO_EXTRAS = (None, None, None, None)
+
+# lightweight view of one entry of a NodeTable, exposing the same attributes as the old per-node objects
+class Node(object):
+    __slots__ = ('table', 'index')
+
+    def __init__(self, table, index):
+        self.table = table
+        self.index = index
+
+    @property
+    def name(self):
+        return self.table.getName(self.index)
+
+    @property
+    def address(self):
+        return self.table.address[self.index]
+
+    @property
+    def real_address(self):
+        return (self.table.address[self.index]<<2)+AXI_BASE_ADDRESS
+
+    @property
+    def permission(self):
+        return PERMISSIONS[self.table.flags[self.index] & (FLAG_PERMISSION | FLAG_READ | FLAG_WRITE)]
 
-    def addChild(self, child):
-        self.children.append(child)
+    @property
+    def mask(self):
+        if self.table.flags[self.index] & FLAG_MASK:
+            return self.table.mask[self.index]
+        return None
+
+    @property
+    def shift(self):
+        return maskShift(self.mask)
+
+    @property
+    def isModule(self):
+        return (self.table.flags[self.index] & FLAG_MODULE) != 0
+
+    @property
+    def parent(self):
+        parent = self.table.parent[self.index]
+        if parent < 0:
+            return None
+        return Node(self.table, parent)
+
+    @property
+    def children(self):
+        return [Node(self.table, child) for child in self.table.getChildren(self.index)]
+
+    @property
+    def level(self):
+        return self.table.level[self.index]
+
+    @property
+    def mode(self):
+        return self.table.extras.get(self.index, NO_EXTRAS)[0]
+
+    @property
+    def size(self):
+        return self.table.extras.get(self.index, NO_EXTRAS)[1]
+
+    # sw_monitor_warn_min_threshold / sw_monitor_error_min_threshold
+    @property
+    def warn_min_value(self):
+        return self.table.extras.get(self.index, NO_EXTRAS)[2]
+
+    @property
+    def error_min_value(self):
+        return self.table.extras.get(self.index, NO_EXTRAS)[3]
+
+    def __eq__(self, other):
+        return isinstance(other, Node) and other.table is self.table and other.index == self.index
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __hash__(self):
+        return hash((id(self.table), self.index))
+
+    def __repr__(self):
+        return '<Node %s>' % self.name
 
     def getVhdlName(self):
         return self.name.replace(TOP_NODE_NAME + '.', '').replace('.', '_')
@@ -35,6 +313,164 @@ class Node:
         print 'Module:',self.isModule
         print 'Parent:',self.parent.name
 
+# Address table that keeps the generate blocks as unexpanded templates (see makeTemplate) and only materializes the nodes
+# that are looked up: e.g. GEM_AMC.OH.OH3.GEB.VFAT7 is resolved by matching "OH3" against the OH${OH_IDX} template and
+# computing its address from generate_address_step, without creating the other OHs or VFATs.
+# Materialized nodes are appended to the usual arrays, so Node views work unchanged, but they are not in DFS order --
+# anything that needs the whole table (address lookups, searching names) expands everything first.
+class LazyNodeTable(NodeTable):
+
+    def __init__(self, template):
+        NodeTable.__init__(self)
+        self.template = template
+
+    def clear(self):
+        NodeTable.clear(self)
+        self.templates = [] # (template node, generate variables) of each materialized node
+        self.childIndex = {} # (parent index, segment id) -> child index
+        self.childLists = {} # parent index -> all its children in address table order, once expanded
+        self.order = None # DFS order, once fully expanded
+
+    # returns the child templates, base address and generate variables for expanding the children of this node
+    def getTemplate(self, parent):
+        if parent < 0:
+            return [] if self.template is None else [self.template], 0x0, {}
+        template, vars = self.templates[parent]
+        return template.children, self.address[parent], vars
+
+    def create(self, parent, seg, template, baseAddress, vars):
+        address = baseAddress
+        if template.address is not None:
+            address = baseAddress + template.address
+        self.templates.append((template, vars))
+        return self.append(seg, parent, address, template.mask, template.permission, template.isModule, template.mode, template.size, template.warnMin, template.errorMin)
+
+    # returns the child with this name, creating it if it isn't materialized yet (like find() it's the first one if several children share a name)
+    def materialize(self, parent, seg, template, baseAddress, vars):
+        key = (parent, self.internSeg(seg))
+        idx = self.childIndex.get(key)
+        if idx is None:
+            idx = self.childIndex[key] = self.create(parent, seg, template, baseAddress, vars)
+        return idx
+
+    # returns (name, base address, variables) of every instance of a template below a node with the given base address and variables
+    def getInstances(self, template, baseAddress, vars):
+        if template.generateSize is None:
+            return [(substituteVars(template.id, vars), baseAddress, vars)]
+        instances = []
+        for i in xrange(template.generateSize):
+            instanceVars = dict(vars)
+            instanceVars[template.generateIdxVar] = i
+            instances.append((substituteVars(template.id, instanceVars), baseAddress + template.generateAddressStep * i, instanceVars))
+        return instances
+
+    # returns (base address, variables) of the instance of a template that has this name, or None
+    def findInstance(self, template, baseAddress, vars, seg):
+        if template.generateSize is None:
+            if substituteVars(template.id, vars) == seg:
+                return baseAddress, vars
+            return None
+        # get the index straight from the name if possible, e.g. 7 from "VFAT7" for VFAT${VFAT_IDX}
+        pattern = substituteVars(template.id, vars)
+        placeholder = '${' + template.generateIdxVar + '}'
+        if pattern.count(placeholder) == 1:
+            prefix, suffix = pattern.split(placeholder)
+            idx = seg[len(prefix) : len(seg) - len(suffix)]
+            if len(seg) <= len(prefix) + len(suffix) or not seg.startswith(prefix) or not seg.endswith(suffix) or not idx.isdigit():
+                return None
+            candidates = [int(idx)]
+        else:
+            candidates = xrange(template.generateSize)
+        for i in candidates:
+            if i >= template.generateSize:
+                continue
+            instanceVars = dict(vars)
+            instanceVars[template.generateIdxVar] = i
+            if substituteVars(template.id, instanceVars) == seg:
+                return baseAddress + template.generateAddressStep * i, instanceVars
+        return None
+
+    def findChildByName(self, parent, seg):
+        segId = self.segIndex.get(seg)
+        if segId is not None:
+            idx = self.childIndex.get((parent, segId))
+            if idx is not None or parent in self.childLists:
+                return idx
+        templates, baseAddress, vars = self.getTemplate(parent)
+        for template in templates:
+            instance = self.findInstance(template, baseAddress, vars, seg)
+            if instance is not None:
+                return self.materialize(parent, seg, template, instance[0], instance[1])
+        return None
+
+    def getChildren(self, idx):
+        children = self.childLists.get(idx)
+        if children is None:
+            templates, baseAddress, vars = self.getTemplate(idx)
+            children = []
+            names = set()
+            for template in templates:
+                for seg, instanceAddress, instanceVars in self.getInstances(template, baseAddress, vars):
+                    if seg in names:
+                        children.append(self.create(idx, seg, template, instanceAddress, instanceVars))
+                    else:
+                        children.append(self.materialize(idx, seg, template, instanceAddress, instanceVars))
+                        names.add(seg)
+            self.childLists[idx] = children
+        return list(children)
+
+    def getTopNodes(self):
+        return self.getChildren(-1)
+
+    def getDescendants(self, idx):
+        if idx < 0:
+            return self.expandAll()
+        return self.walk(idx)
+
+    # materializes the subtree and returns its node indices in DFS order
+    def walk(self, idx):
+        descendants = []
+        stack = self.getChildren(idx)
+        stack.reverse()
+        while len(stack) > 0:
+            child = stack.pop()
+            descendants.append(child)
+            children = self.getChildren(child)
+            children.reverse()
+            stack.extend(children)
+        return descendants
+
+    def findDescendantsByName(self, idx, name):
+        descendants = self.getDescendants(idx) # segments are only interned once materialized
+        segId = self.segIndex.get(name)
+        seg = self.seg
+        return [i for i in descendants if seg[i] == segId]
+
+    # materializes the whole table and returns the node indices in DFS order
+    def expandAll(self):
+        if self.order is None:
+            order = self.walk(-1)
+            self.order = array.array('I', order)
+            self.byAddress = array.array('I', sorted(order, key=self.address.__getitem__))
+        return self.order
+
+    def __iter__(self):
+        for i in self.expandAll():
+            yield Node(self, i)
+
+    def findAddress(self, real_address):
+        self.expandAll()
+        return NodeTable.findAddress(self, real_address)
+
+    def iterNames(self):
+        for i in self.expandAll():
+            yield i, self.getName(i)
+
+nodes = NodeTable()
+nodesByName = {} # views resolved so far
+tableLock = threading.RLock() # lookups can add nodes to a LazyNodeTable, so they are serialized for runConcurrently
+topNodes = []
+
 def main():
     parseXML()
     print 'Example:'
@@ -46,17 +482,166 @@ def main():
     getAllChildren(random_node, kids)
     print len(kids), kids.name
 
-def parseXML(filename = None, num_of_oh = None):
+# station can be given as a string ("0" for ME0, "1" for GE1/1, "2" for GE2/1) to skip nodes that are not present at that station (gem_stations attribute)
+# the expanded table is cached in a binary file and reloaded from there as long as the XML content, num_of_oh and station are the same
+# with shared = True (the default if ADDRESS_TABLE_SHARED_DIR is set and exists) that file is kept in shared memory and mapped instead of
+# copied, so all processes using the same table on the board share one copy of it and only the first one parses the XML
+# with lazy = True the generate blocks are not expanded up front, only the nodes that are looked up are (see LazyNodeTable) --
+# this is much faster and smaller for scripts that only use getNode on a few registers, but slower for ones that search the whole table
+def parseXML(filename = None, num_of_oh = None, station = None, useCache = True, lazy = False, shared = None):
+    global nodes
     if filename == None:
         filename = ADDRESS_TABLE_TOP
-    print 'Parsing',filename,'...'
-    tree = xml.parse(filename)
-    root = tree.getroot()[0]
-    vars = {}
-    makeTree(root,'',0x0,nodes,None,vars,False,num_of_oh)
+    if lazy:
+        print 'Parsing',filename,'(lazy) ...'
+        nodes = LazyNodeTable(makeTemplate(xml.parse(filename).getroot()[0], num_of_oh, station))
+        buildIndex()
+        return
+    if isinstance(nodes, LazyNodeTable):
+        nodes = NodeTable()
+    if shared is None:
+        shared = ADDRESS_TABLE_SHARED_DIR is not None and os.path.isdir(ADDRESS_TABLE_SHARED_DIR)
+    if not useCache or not loadCache(filename, num_of_oh, station, shared):
+        print 'Parsing',filename,'...'
+        tree = xml.parse(filename)
+        root = tree.getroot()[0]
+        vars = {}
+        nodes.clear()
+        makeTree(root,0x0,nodes,-1,vars,False,num_of_oh,station)
+        nodes.finalize()
+        if useCache:
+            # publish it, and switch over to the published copy so that this process doesn't keep a private one
+            if saveCache(filename, num_of_oh, station, shared) and shared:
+                loadCache(filename, num_of_oh, station, shared)
+    buildIndex()
+
+def buildIndex():
+    nodesByName.clear()
+    nodeSets.clear()
+    del topNodes[:]
+    topNodes.extend(Node(nodes, idx) for idx in nodes.getTopNodes())
+
+########## compiled address table cache ##########
+#
+# file layout (native byte order):
+#   header: magic, version, key digest (sha1 of xml content + num_of_oh + station), number of nodes, name segments blob length, extras length
+#   the NodeTable arrays in the order of CACHE_ARRAYS (childOffset has two more entries than the others, the byte arrays are
+#   last so that all the 32bit ones are aligned)
+#   name segments blob ('\n' separated), extras (json: sparse block mode / size and monitoring thresholds)
+
+CACHE_MAGIC = 'RWREGTBL'
+CACHE_HEADER = struct.Struct('8sI20sIII')
+CACHE_ARRAYS = ['seg', 'parent', 'end', 'address', 'mask', 'childOffset', 'childList', 'byAddress', 'level', 'flags']
+CACHE_CTYPES = {'I': ctypes.c_uint32, 'i': ctypes.c_int32, 'B': ctypes.c_uint8}
+CACHE_TYPECODES = dict((arrayName, getattr(NodeTable(), arrayName).typecode) for arrayName in CACHE_ARRAYS) # (the loaded arrays may be ctypes ones)
+
+def getCacheFilename(filename, num_of_oh, station, shared = False):
+    cacheDir = ADDRESS_TABLE_CACHE_DIR
+    name = os.path.basename(filename)
+    if cacheDir is None and shared:
+        # all tables share one directory, so tell apart the XML files of the same name
+        cacheDir = ADDRESS_TABLE_SHARED_DIR
+        name = 'rw_reg.%s.%s' % (hashlib.sha1(os.path.abspath(filename)).hexdigest()[:8], name)
+    if cacheDir is None:
+        cacheDir = os.path.dirname(os.path.abspath(filename))
+    return os.path.join(cacheDir, '%s.oh%s.st%s.cache' % (name, num_of_oh, station))
+
+def getCacheKey(filename, num_of_oh, station):
+    f = open(filename, 'rb')
+    key = hashlib.sha1(f.read())
+    f.close()
+    key.update('%d:%s:%s:%s' % (ADDRESS_TABLE_CACHE_VERSION, num_of_oh, station, AXI_BASE_ADDRESS))
+    return key.digest()
+
+# returns True if the cache file was written
+def saveCache(filename, num_of_oh, station, shared = False):
+    cacheFilename = getCacheFilename(filename, num_of_oh, station, shared)
+    segs = '\n'.join(nodes.segs)
+    extras = json.dumps(nodes.extras)
+
+    tmpFilename = '%s.%d.tmp' % (cacheFilename, os.getpid())
+    try:
+        f = open(tmpFilename, 'wb')
+        f.write(CACHE_HEADER.pack(CACHE_MAGIC, ADDRESS_TABLE_CACHE_VERSION, getCacheKey(filename, num_of_oh, station), len(nodes), len(segs), len(extras)))
+        for arrayName in CACHE_ARRAYS:
+            getattr(nodes, arrayName).tofile(f)
+        f.write(segs)
+        f.write(extras)
+        f.close()
+        # readable by the other users' processes, but replaced rather than modified
+        os.chmod(tmpFilename, 0444)
+        os.rename(tmpFilename, cacheFilename)
+    except (IOError, OSError):
+        # e.g. read-only filesystem -- the cache is an optimization only
+        if os.path.exists(tmpFilename):
+            os.remove(tmpFilename)
+        return False
+    return True
+
+# returns True if the table was loaded from a valid cache file, False if the XML has to be parsed
+# with shared = True the arrays of the table point straight into the mapped file instead of being copied: the mapping is
+# copy-on-write and never written to, so the pages stay shared with every other process that maps the same file
+# The whole file is checked and decoded before the table is replaced, so a truncated or corrupt cache leaves it as it was.
+def loadCache(filename, num_of_oh, station, shared = False):
+    cacheFilename = getCacheFilename(filename, num_of_oh, station, shared)
+    if not os.path.exists(cacheFilename):
+        return False
+    f = open(cacheFilename, 'rb')
+    try:
+        mem = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY if shared else mmap.ACCESS_READ)
+    except (mmap.error, ValueError):
+        f.close()
+        return False
+    exported = False # ctypes arrays point into mem, so it must not be closed (it goes away with them)
+    try:
+        if len(mem) < CACHE_HEADER.size:
+            return False
+        magic, version, key, numNodes, segsLen, extrasLen = CACHE_HEADER.unpack_from(mem, 0)
+        if magic != CACHE_MAGIC or version != ADDRESS_TABLE_CACHE_VERSION or key != getCacheKey(filename, num_of_oh, station):
+            return False
+        lengths = [(arrayName, CACHE_TYPECODES[arrayName], numNodes + 2 if arrayName == 'childOffset' else numNodes) for arrayName in CACHE_ARRAYS]
+        if len(mem) != CACHE_HEADER.size + sum(length * array.array(typecode).itemsize for arrayName, typecode, length in lengths) + segsLen + extrasLen:
+            print 'Ignoring truncated address table cache',cacheFilename
+            return False
+        try:
+            arrays = []
+            offset = CACHE_HEADER.size
+            for arrayName, typecode, length in lengths:
+                if shared:
+                    arr = (CACHE_CTYPES[typecode] * length).from_buffer(mem, offset)
+                    exported = True
+                else:
+                    arr = array.array(typecode)
+                    arr.fromstring(mem[offset : offset + length * arr.itemsize])
+                arrays.append((arrayName, arr))
+                offset += length * array.array(typecode).itemsize
+            segs = mem[offset : offset + segsLen].split('\n')
+            offset += segsLen
+            extras = dict((int(idx), tuple(None if value is None else str(value) for value in values))
+                          for idx, values in json.loads(mem[offset : offset + extrasLen]).items())
+        except (ValueError, TypeError, struct.error):
+            print 'Ignoring corrupt address table cache',cacheFilename
+            return False
+        print 'Loading cached address table',cacheFilename,'...'
+        nodes.clear()
+        for arrayName, arr in arrays:
+            setattr(nodes, arrayName, arr)
+        nodes.segs = segs
+        nodes.segIndex = dict((seg, segId) for segId, seg in enumerate(segs))
+        nodes.extras = extras
+        if shared:
+            nodes.sharedMemory = mem
+    finally:
+        if not exported:
+            mem.close()
+        f.close()
+    return True
+
+def makeTree(node,baseAddress,table,parentIdx,vars,isGenerated,num_of_oh=None,station=None):
+
+    if station is not None and node.get('gem_stations') is not None and station not in node.get('gem_stations'):
+        return
 
-def makeTree(node,baseName,baseAddress,nodes,parentNode,vars,isGenerated,num_of_oh=None):
-    
     if (isGenerated == None or isGenerated == False) and node.get('generate') is not None and node.get('generate') == 'true':
         if (node.get('generate_idx_var') == 'OH_IDX' and num_of_oh is not None):
             generateSize = num_of_oh
@@ -68,35 +653,48 @@ def makeTree(node,baseName,baseAddress,nodes,parentNode,vars,isGenerated,num_of_
         for i in range(0, generateSize):
             vars[generateIdxVar] = i
             #print('generate base_addr = ' + hex(baseAddress + generateAddressStep * i) + ' for node ' + node.get('id'))
-            makeTree(node, baseName, baseAddress + generateAddressStep * i, nodes, parentNode, vars, True)
+            makeTree(node, baseAddress + generateAddressStep * i, table, parentIdx, vars, True, num_of_oh, station)
         return
-    newNode = Node()
-    name = baseName
-    if baseName != '': name += '.'
-    name += node.get('id')
-    name = substituteVars(name, vars)
-    newNode.name = name
-    #print len(nodes), name
-    #print newNode.name
     address = baseAddress
     if node.get('address') is not None:
         address = baseAddress + parseInt(node.get('address'))
-    newNode.address = address
-    newNode.real_address = (address<<2)+0x64000000
-    newNode.permission = node.get('permission')
-    newNode.mask = parseInt(node.get('mask'))
-    newNode.isModule = node.get('fw_is_module') is not None and node.get('fw_is_module') == 'true'
-    if node.get('mode') is not None:
-        newNode.mode = node.get('mode')
-    if node.get('size') is not None:
-        newNode.size = node.get('size')
-    nodes.append(newNode)
-    if parentNode is not None:
-        parentNode.addChild(newNode)
-        newNode.parent = parentNode
-        newNode.level = parentNode.level+1
+    isModule = node.get('fw_is_module') is not None and node.get('fw_is_module') == 'true'
+    idx = table.append(substituteVars(node.get('id'), vars), parentIdx, address, parseInt(node.get('mask')), node.get('permission'), isModule,
+                       node.get('mode'), node.get('size'), node.get('sw_monitor_warn_min_threshold'), node.get('sw_monitor_error_min_threshold'))
     for child in node:
-        makeTree(child,name,address,nodes,newNode,vars,False,num_of_oh)
+        makeTree(child,address,table,idx,vars,False,num_of_oh,station)
+    table.close(idx)
+
+# one node of the address table as written in the XML, with its generate attributes not expanded yet
+class TemplateNode(object):
+    __slots__ = ('id', 'address', 'mask', 'permission', 'isModule', 'mode', 'size', 'warnMin', 'errorMin', 'generateSize', 'generateAddressStep', 'generateIdxVar', 'children')
+
+# converts the XML tree into TemplateNodes, leaving out the nodes that are not present at the given station (returns None if the node itself isn't)
+def makeTemplate(node, num_of_oh=None, station=None):
+    if station is not None and node.get('gem_stations') is not None and station not in node.get('gem_stations'):
+        return None
+    template = TemplateNode()
+    template.id = node.get('id')
+    template.address = parseInt(node.get('address'))
+    template.mask = parseInt(node.get('mask'))
+    template.permission = node.get('permission')
+    template.isModule = node.get('fw_is_module') is not None and node.get('fw_is_module') == 'true'
+    template.mode = node.get('mode')
+    template.size = node.get('size')
+    template.warnMin = node.get('sw_monitor_warn_min_threshold')
+    template.errorMin = node.get('sw_monitor_error_min_threshold')
+    template.generateSize = None
+    template.generateAddressStep = None
+    template.generateIdxVar = None
+    if node.get('generate') is not None and node.get('generate') == 'true':
+        template.generateIdxVar = node.get('generate_idx_var')
+        if template.generateIdxVar == 'OH_IDX' and num_of_oh is not None:
+            template.generateSize = num_of_oh
+        else:
+            template.generateSize = parseInt(node.get('generate_size'))
+        template.generateAddressStep = parseInt(node.get('generate_address_step'))
+    template.children = [child for child in (makeTemplate(child, num_of_oh, station) for child in node) if child is not None]
+    return template
 
 
 def getAllChildren(node,kids=[]):
@@ -108,91 +706,930 @@ def getAllChildren(node,kids=[]):
             getAllChildren(child,kids)
 
 def getNode(nodeName):
-    return next((node for node in nodes if node.name == nodeName),None)
+    node = nodesByName.get(nodeName)
+    if node is None:
+        with tableLock:
+            if stats is not None:
+                start = time.time()
+                idx = nodes.find(nodeName)
+                stats.record('lookup', time.time() - start)
+            else: idx = nodes.find(nodeName)
+            if idx is None: return None
+            node = nodesByName[nodeName] = Node(nodes, idx)
+    return node
 
 def getNodeFromAddress(nodeAddress):
-    return next((node for node in nodes if node.real_address == nodeAddress),None)
+    matches = nodes.findAddress(nodeAddress)
+    if len(matches) == 0: return None
+    return Node(nodes, matches[0])
+
+#returns all nodes (registers and their parents) sharing this address
+def getNodesFromAddress(nodeAddress):
+    return [Node(nodes, idx) for idx in nodes.findAddress(nodeAddress)]
 
 def getNodesContaining(nodeString):
-    nodelist = [node for node in nodes if nodeString in node.name]
+    nodelist = [Node(nodes, idx) for idx, name in nodes.iterNames() if nodeString in name]
     if len(nodelist): return nodelist
     else: return None
 
 #returns *readable* registers
 def getRegsContaining(nodeString):
-    nodelist = [node for node in nodes if nodeString in node.name and node.permission is not None and 'r' in node.permission]
+    flags = nodes.flags
+    nodelist = [Node(nodes, idx) for idx, name in nodes.iterNames() if flags[idx] & FLAG_READ and nodeString in name]
     if len(nodelist): return nodelist
     else: return None
 
+########## node queries ##########
+
+# Patterns are matched one dot-separated segment at a time, following the children index of the table, so only the
+# branches that can match are visited: a segment without wildcards is a plain child lookup, one with shell wildcards
+# (* ? [seq], see fnmatch) is matched against the names of the children, and ** stands for any number of levels, none included:
+#   GEM_AMC.OH.OH*.GEB.VFAT*.CFG_LATENCY      CFG_LATENCY of every VFAT
+#   **.TRIGGER.OH0.CLUSTER*.**                the cluster registers of OH0 and everything below them
+# With regex = True the pattern is a regular expression that has to match the whole name (this goes through every name).
+# The resulting NodeSets are cached until the table is reloaded, so repeating a query (e.g. in a scan loop) is a dict lookup.
+
+nodeSets = {} # (pattern, regex) -> NodeSet
+
+def queryNodes(pattern, regex = False):
+    key = (pattern, regex)
+    nodeSet = nodeSets.get(key)
+    if nodeSet is None:
+        with tableLock:
+            if regex:
+                match = re.compile(pattern + r'\Z').match
+                indices = [idx for idx, name in nodes.iterNames() if match(name)]
+            else:
+                indices = globNodes(pattern)
+            nodeSet = nodeSets[key] = NodeSet([Node(nodes, idx) for idx in indices])
+    return nodeSet
+
+def isWildcard(seg):
+    return '*' in seg or '?' in seg or '[' in seg
+
+# returns the indices of the nodes matching a glob pattern, in DFS order (traversal order for a LazyNodeTable)
+def globNodes(pattern):
+    matches = [-1]
+    parts = pattern.split('.')
+    while len(parts) > 0:
+        part = parts.pop(0)
+        found = []
+        if part == '**' and len(parts) > 0 and parts[0] != '**' and not isWildcard(parts[0]):
+            # **.NAME: straight from the name segment index
+            part = parts.pop(0)
+            for idx in matches:
+                found.extend(nodes.findDescendantsByName(idx, part))
+        elif part == '**':
+            for idx in matches:
+                found.append(idx)
+                found.extend(nodes.getDescendants(idx))
+        elif isWildcard(part):
+            match = re.compile(fnmatch.translate(part)).match
+            segs, seg = nodes.segs, nodes.seg
+            for idx in matches:
+                children = nodes.getTopNodes() if idx < 0 else nodes.getChildren(idx)
+                found.extend(child for child in children if match(segs[seg[child]]))
+        else:
+            for idx in matches:
+                child = nodes.findChildByName(idx, part)
+                if child is not None:
+                    found.append(child)
+        seen = set()
+        matches = [idx for idx in found if idx not in seen and not seen.add(idx)]
+    matches = [idx for idx in matches if idx >= 0]
+    if not isinstance(nodes, LazyNodeTable):
+        matches.sort()
+    return matches
+
+# A fixed list of nodes with their real addresses, masks and shifts as arrays, for code that works on many registers at
+# once. read() and write() go through a ReadPlan / WriteTransaction, so they touch every 32bit word only once.
+class NodeSet:
+
+    def __init__(self, regs):
+        self.regs = regs
+        self.addresses = array.array('I', [reg.real_address for reg in regs])
+        self.masks = array.array('I', [0xffffffff if reg.mask is None else reg.mask for reg in regs])
+        self.shifts = array.array('B', [maskShift(reg.mask) for reg in regs])
+        self.readableSet = None
+        self.plan = None
+
+    def __len__(self):
+        return len(self.regs)
+
+    def __iter__(self):
+        return iter(self.regs)
+
+    def __getitem__(self, i):
+        return self.regs[i]
+
+    def getNames(self):
+        return [reg.name for reg in self.regs]
+
+    # the subset of registers with read permission (e.g. to read a query that also matched modules)
+    def readable(self):
+        if self.readableSet is None:
+            self.readableSet = NodeSet([reg for reg in self.regs if isReadable(reg)])
+        return self.readableSet
+
+    # returns the field values in the order of the nodes (BusError instances for failed reads)
+    def read(self):
+        if self.plan is None:
+            for reg in self.regs:
+                checkReadable(reg)
+            self.plan = ReadPlan(self.regs)
+        return self.plan.read()
+
+    # writes one value to all nodes, or a sequence of values (one per node) in one WriteTransaction, returns the number of words written
+    def write(self, values):
+        if isinstance(values, (int, long)):
+            values = [values] * len(self.regs)
+        elif len(values) != len(self.regs):
+            raise ValueError('Got %d values for %d nodes' % (len(values), len(self.regs)))
+        transaction = WriteTransaction()
+        for reg, value in zip(self.regs, values):
+            transaction.write(reg, value)
+        return transaction.commit()
+
+
+class BusError(Exception):
+    def __init__(self, code):
+        Exception.__init__(self, parseError(code))
+        self.code = code
+
+# raised when reading a register without read permission or writing one without write permission
+class NoPermissionError(ValueError):
+    pass
+
+# forks the mpeek / mpoke binaries for every access -- slow, but it's the only backend that survives a bus error
+class SubprocessBackend:
+    name = 'subprocess'
+
+    def read(self, address):
+        try: output = subprocess.check_output('mpeek '+str(address), stderr=subprocess.STDOUT , shell=True)
+        except subprocess.CalledProcessError as e: raise BusError(e.returncode)
+        return parseInt(''.join(s for s in output if s.isalnum()))
+
+    def write(self, address, value):
+        try: subprocess.check_output('mpoke '+str(address)+' '+str(value), stderr=subprocess.STDOUT , shell=True)
+        except subprocess.CalledProcessError as e: raise BusError(e.returncode)
+
+    def readBlock(self, address, count):
+        return [self.read(address + 4*i) for i in xrange(count)]
+
+    def readInto(self, address, buf, count):
+        for i in xrange(count):
+            buf[i] = self.read(address + 4*i)
+
+    def writeFrom(self, address, buf, count):
+        for i in xrange(count):
+            self.write(address + 4*i, int(buf[i]))
+
+# maps the AXI window into the process and accesses it with single 32bit loads and stores
+# NOTE: an access to an address that doesn't respond on the bus kills the process with SIGBUS instead of raising BusError,
+# which is why it has to be asked for with RW_REG_BACKEND=mmap
+class MmapBackend:
+    name = 'mmap'
+
+    def __init__(self, filename = DEV_MEM, base = AXI_BASE_ADDRESS, size = AXI_WINDOW_SIZE, offset = None):
+        if offset is None:
+            offset = base
+        fd = os.open(filename, os.O_RDWR | os.O_SYNC)
+        try: self.mem = mmap.mmap(fd, size, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE, offset=offset)
+        finally: os.close(fd)
+        self.words = (ctypes.c_uint32 * (size >> 2)).from_buffer(self.mem)
+        self.base = base
+        self.size = size
+
+    def wordIndex(self, address):
+        offset = address - self.base
+        if offset < 0 or offset >= self.size or offset & 0x3:
+            raise BusError(1)
+        return offset >> 2
+
+    def read(self, address):
+        return self.words[self.wordIndex(address)]
+
+    def write(self, address, value):
+        self.words[self.wordIndex(address)] = value
+
+    # reads count consecutive 32bit words starting at address
+    def readBlock(self, address, count):
+        start = self.wordIndex(address)
+        self.wordIndex(address + 4*(count-1))
+        return self.words[start:start+count]
+
+    # copy count words between the window and a writable buffer of 32bit words (array('I'), numpy uint32) in one go
+    def readInto(self, address, buf, count):
+        start = self.wordIndex(address)
+        self.wordIndex(address + 4*(count-1))
+        ctypes.memmove((ctypes.c_uint32 * count).from_buffer(buf), ctypes.addressof(self.words) + 4*start, 4*count)
+
+    def writeFrom(self, address, buf, count):
+        start = self.wordIndex(address)
+        self.wordIndex(address + 4*(count-1))
+        ctypes.memmove(ctypes.addressof(self.words) + 4*start, (ctypes.c_uint32 * count).from_buffer(buf), 4*count)
+
+# off-board stand-in for the AXI window: a plain (sparse) file mapped the same way, for testing and benchmarking without a CTP7
+class FileBackend(MmapBackend):
+    name = 'file'
+
+    def __init__(self, filename, base = AXI_BASE_ADDRESS, size = AXI_WINDOW_SIZE):
+        f = open(filename, 'ab')
+        if os.path.getsize(filename) < size:
+            f.truncate(size)
+        f.close()
+        MmapBackend.__init__(self, filename, base, size, 0)
+
+backend = None
+
+# RW_REG_BACKEND can be set to "subprocess" (default), "mmap" or "file:<path>"
+# mmap is opt-in because a bus error on it kills the process (see MmapBackend), only use it when all the registers that
+# will be accessed are known to respond (e.g. no OH / VFAT registers of links that may be down)
+def getBackend():
+    global backend
+    if backend is None:
+        choice = os.environ.get('RW_REG_BACKEND', 'subprocess')
+        if choice.startswith('file:'):
+            backend = FileBackend(choice[5:])
+        elif choice == 'mmap':
+            try: backend = MmapBackend()
+            except (OSError, IOError, ValueError, mmap.error): backend = SubprocessBackend()
+        else:
+            backend = SubprocessBackend()
+    return backend
+
+def setBackend(newBackend):
+    global backend
+    backend = newBackend
+
+# raw 32bit access by real (AXI) address -- returns / takes plain ints and raises BusError
+def rReg(address):
+    if stats is not None:
+        return stats.time('read', getBackend().read, address)
+    return getBackend().read(address)
+
+def wReg(address, value):
+    if stats is not None: stats.time('write', getBackend().write, address, value)
+    else: getBackend().write(address, value)
+    if shadow is not None and address in shadow.words:
+        shadow.words[address] = value
+
+########## access statistics ##########
+
+# Off by default, and then only costs a "stats is not None" check per access. Set RW_REG_STATS=<file.json|file.csv> to
+# record a whole script and write the report at exit, or call enableStats() / dumpStats() (reg_interface: "stats" command).
+# Latencies are of the backend calls only, so comparing them with the total time shows how much goes into lookups and formatting.
+class AccessStats:
+
+    def __init__(self):
+        self.start = time.time()
+        self.timers = {} # operation -> [count, total seconds, {latency bucket: count}]
+        self.busErrors = {} # error message -> count
+        self.nodeCounts = {} # node -> [reads, writes]
+        self.rmwReads = {} # real address -> number of extra reads done to preserve the other bits of the word
+
+    def record(self, operation, elapsed):
+        timer = self.timers.get(operation)
+        if timer is None:
+            timer = self.timers[operation] = [0, 0.0, {}]
+        timer[0] += 1
+        timer[1] += elapsed
+        # bucket n holds the latencies below 2^n us
+        bucket = int(elapsed * 1e6).bit_length()
+        timer[2][bucket] = timer[2].get(bucket, 0) + 1
+
+    # calls the given backend function, recording its latency and any bus error
+    def time(self, operation, function, *args):
+        start = time.time()
+        try: return function(*args)
+        except BusError as e:
+            self.busErrors[str(e)] = self.busErrors.get(str(e), 0) + 1
+            raise
+        finally:
+            self.record(operation, time.time() - start)
+
+    def countRead(self, reg):
+        counts = self.nodeCounts.get(reg)
+        if counts is None:
+            counts = self.nodeCounts[reg] = [0, 0]
+        counts[0] += 1
+
+    def countWrite(self, reg):
+        counts = self.nodeCounts.get(reg)
+        if counts is None:
+            counts = self.nodeCounts[reg] = [0, 0]
+        counts[1] += 1
+
+    def countRmwRead(self, address):
+        self.rmwReads[address] = self.rmwReads.get(address, 0) + 1
+
+    # per-module totals, a module being the closest parent marked fw_is_module (or the top node)
+    def getModuleCounts(self):
+        modules = {}
+        for reg, (reads, writes) in self.nodeCounts.items():
+            module = reg
+            while module.parent is not None and not module.isModule:
+                module = module.parent
+            counts = modules.setdefault(module.name, [0, 0])
+            counts[0] += reads
+            counts[1] += writes
+        return modules
+
+    def getReport(self):
+        operations = {}
+        for operation, (count, total, histogram) in self.timers.items():
+            operations[operation] = {'count': count, 'total': total, 'mean': total / count,
+                                     'histogram': dict(('<%dus' % (1 << bucket), n) for bucket, n in histogram.items())}
+        return {'elapsed': time.time() - self.start,
+                'operations': operations,
+                'busErrors': self.busErrors,
+                'rmwReads': sum(self.rmwReads.values()),
+                'rmwReadsByAddress': dict((hex(address).rstrip('L'), n) for address, n in self.rmwReads.items()),
+                'nodes': dict((reg.name, {'reads': reads, 'writes': writes}) for reg, (reads, writes) in self.nodeCounts.items()),
+                'modules': dict((name, {'reads': reads, 'writes': writes}) for name, (reads, writes) in self.getModuleCounts().items())}
+
+    # writes the report as JSON, or as CSV (one line per node and module, then the operation totals) if the file name doesn't end with .json
+    def dump(self, filename):
+        f = open(filename, 'w')
+        if filename.endswith('.json'):
+            json.dump(self.getReport(), f, indent=2, sort_keys=True)
+        else:
+            f.write('type,name,reads,writes,count,total,mean\n')
+            for reg, (reads, writes) in sorted(self.nodeCounts.items(), key=lambda item: -sum(item[1])):
+                f.write('node,%s,%d,%d,,,\n' % (reg.name, reads, writes))
+            for name, (reads, writes) in sorted(self.getModuleCounts().items()):
+                f.write('module,%s,%d,%d,,,\n' % (name, reads, writes))
+            for operation, (count, total, histogram) in sorted(self.timers.items()):
+                f.write('operation,%s,,,%d,%f,%f\n' % (operation, count, total, total / count))
+            for message, count in sorted(self.busErrors.items()):
+                f.write('busError,%s,,,%d,,\n' % (message, count))
+            f.write('rmwReads,,,,%d,,\n' % sum(self.rmwReads.values()))
+        f.close()
+
+    # short human readable summary with the most accessed registers
+    def summary(self, top = 10):
+        lines = ['Elapsed: %.3f s' % (time.time() - self.start)]
+        for operation, (count, total, histogram) in sorted(self.timers.items()):
+            lines.append('%s: %d in %.3f s (%.1f us each)' % (operation, count, total, 1e6 * total / count))
+        for message, count in sorted(self.busErrors.items()):
+            lines.append('%s: %d' % (message, count))
+        lines.append('RMW extra reads: %d' % sum(self.rmwReads.values()))
+        for reg, (reads, writes) in sorted(self.nodeCounts.items(), key=lambda item: -sum(item[1]))[:top]:
+            lines.append('%s\t%d reads %d writes' % (tabPad(reg.name, 7), reads, writes))
+        return lines
+
+stats = None
+
+def enableStats(reportFilename = None):
+    global stats
+    stats = AccessStats()
+    if reportFilename is not None:
+        atexit.register(dumpStatsAtExit, reportFilename)
+    return stats
+
+def disableStats():
+    global stats
+    stats = None
+
+def dumpStats(filename):
+    if stats is not None: stats.dump(filename)
+
+def dumpStatsAtExit(filename):
+    try: dumpStats(filename)
+    except (IOError, OSError) as e: print 'Could not write the register access report',filename,':',str(e)
+
+########## shadow register cache ##########
+
+# writes to registers with this in the last segment of their name (MODULE_RESET, LINK_RESET, CNT_RESET, ...) drop the whole shadow
+SHADOW_RESET_KEYWORD = 'RESET'
+
+# Remembers the last value written to or read from each writable 32bit word, so that masked writes can merge with it
+# instead of reading the word back from the hardware first. With verifyInterval = N every Nth merge served from the
+# shadow is checked against the hardware (a mismatch is counted, printed and corrected).
+class ShadowCache:
+
+    def __init__(self, verifyInterval = 0):
+        self.words = {}
+        self.verifyInterval = verifyInterval
+        self.hits = 0
+        self.misses = 0
+        self.mismatches = 0
+
+    # returns the word at this address, reading it from the hardware only if it's not known yet (or due for verification)
+    def get(self, address):
+        value = self.words.get(address)
+        if value is None:
+            self.misses += 1
+            value = self.words[address] = rReg(address)
+            return value
+        self.hits += 1
+        if self.verifyInterval and self.hits % self.verifyInterval == 0:
+            actual = rReg(address)
+            if actual != value:
+                self.mismatches += 1
+                print 'Shadow register cache mismatch at',hex(address).rstrip('L'),'expected','{0:#010x}'.format(value),'read','{0:#010x}'.format(actual)
+                value = self.words[address] = actual
+        return value
+
+    def update(self, address, value):
+        self.words[address] = value
+
+    def invalidate(self, address = None):
+        if address is None: self.words.clear()
+        else: self.words.pop(address, None)
+
+    # compares every shadowed word against the hardware, corrects the shadow and returns the list of mismatching addresses
+    def verify(self):
+        addresses = sorted(self.words.keys())
+        mismatches = []
+        for address, actual in zip(addresses, readBlocks(makeBlocks(addresses))):
+            if isinstance(actual, BusError):
+                self.invalidate(address)
+            elif actual != self.words[address]:
+                mismatches.append(address)
+                self.words[address] = actual
+        self.mismatches += len(mismatches)
+        return mismatches
+
+shadow = None
+
+# the shadow cache is off by default -- only enable it when nothing else (firmware, other processes) writes the same registers
+def enableShadow(verifyInterval = 0):
+    global shadow
+    shadow = ShadowCache(verifyInterval)
+    return shadow
+
+def disableShadow():
+    global shadow
+    shadow = None
+
+def verifyShadow():
+    if shadow is None: return []
+    return shadow.verify()
+
+def isResetReg(reg):
+    return SHADOW_RESET_KEYWORD in reg.name.rsplit('.',1)[-1]
+
+# returns the current content of a word that is about to be partially overwritten
+def readWordForMerge(address):
+    if stats is not None and (shadow is None or address not in shadow.words):
+        stats.countRmwRead(address)
+    if shadow is not None:
+        return shadow.get(address)
+    return rReg(address)
+
+# keeps the shadow in sync after a register write
+def updateShadowAfterWrite(reg, value):
+    if isResetReg(reg): shadow.invalidate()
+    elif isReadable(reg): shadow.update(reg.real_address, value)
+
+# returns the number of bits a field value has to be shifted by to line up with its mask
+def maskShift(mask):
+    if not mask:
+        return 0
+    return (mask & -mask).bit_length() - 1
+
+# merges a list of real addresses into [start address, number of words] runs of consecutive 32bit words
+def makeBlocks(addresses):
+    blocks = []
+    for address in sorted(set(addresses)):
+        if len(blocks) > 0 and blocks[-1][0] + 4*blocks[-1][1] == address:
+            blocks[-1][1] += 1
+        else:
+            blocks.append([address, 1])
+    return blocks
+
+# returns the raw 32bit words of the given blocks in address order, with a BusError instance in place of any word that could not be read
+def readBlocks(blocks):
+    backend = getBackend()
+    words = []
+    for address, count in blocks:
+        try:
+            if stats is not None: words.extend(stats.time('readBlock', backend.readBlock, address, count))
+            else: words.extend(backend.readBlock(address, count))
+        except BusError:
+            # narrow it down to the failing word(s)
+            for i in xrange(count):
+                try: words.append(rReg(address + 4*i))
+                except BusError as e: words.append(e)
+    return words
+
+# Reads a fixed set of readable registers touching every 32bit word only once: the words are sorted and merged into
+# runs of consecutive addresses that are read as blocks, then all fields are extracted with precomputed masks and shifts.
+# A plan can be kept and read() repeatedly (e.g. for polling).
+class ReadPlan:
+
+    def __init__(self, regs):
+        self.regs = list(regs)
+        addresses = sorted(set(reg.real_address for reg in self.regs))
+        slots = dict((address, i) for i, address in enumerate(addresses))
+        self.slots = [slots[reg.real_address] for reg in self.regs]
+        self.masks = [0xffffffff if reg.mask is None else reg.mask for reg in self.regs]
+        self.shifts = [maskShift(reg.mask) for reg in self.regs]
+        self.blocks = makeBlocks(addresses)
+        self.numWords = len(addresses)
+        self.writableSlots = sorted(set(slot for slot, reg in zip(self.slots, self.regs) if isWritable(reg)))
+        self.addresses = addresses
+
+    def readWords(self):
+        return readBlocks(self.blocks)
+
+    # returns the field values in the order of the registers given to the constructor (BusError instances for failed reads)
+    def read(self):
+        words = self.readWords()
+        if shadow is not None:
+            for slot in self.writableSlots:
+                if not isinstance(words[slot], BusError): shadow.update(self.addresses[slot], words[slot])
+        if stats is not None:
+            for reg in self.regs: stats.countRead(reg)
+        values = []
+        for slot, mask, shift in zip(self.slots, self.masks, self.shifts):
+            word = words[slot]
+            if isinstance(word, BusError): values.append(word)
+            else: values.append((word & mask) >> shift)
+        return values
+
+def isReadable(reg):
+    return reg.permission is not None and 'r' in reg.permission
+
+def isWritable(reg):
+    return reg.permission is not None and 'w' in reg.permission
+
+def checkReadable(reg):
+    if not isReadable(reg):
+        raise NoPermissionError('No read permission for %s' % reg.name)
+
+def checkWritable(reg):
+    if not isWritable(reg):
+        raise NoPermissionError('No write permission for %s' % reg.name)
+
+# Accumulates field writes and merges them per 32bit word, so that commit() issues one full-word write per touched
+# address. Bits of a word that were not written in the transaction are preserved with a single read (all such reads are
+# coalesced and done before the first write), which is skipped if the whole word was given or the word is write-only.
+# Words are written in the order they were first touched. Can be used as a context manager, committing on a clean exit:
+#   with WriteTransaction() as t:
+#       t.write(getNode('GEM_AMC.OH.OH0.GEB.VFAT0.CFG_LATENCY'), 45)
+class WriteTransaction:
+
+    def __init__(self):
+        self.discard()
+
+    def write(self, reg, value):
+        checkWritable(reg)
+        self.writeField(reg.real_address, reg.mask, value, isReadable(reg), reg)
+
+    # writes a field given by its address and mask (None for the whole word) without checking the permission,
+    # reg is the node it is counted against in the statistics (and checked for being a reset)
+    def writeField(self, address, mask, value, readable, reg):
+        if shadow is not None and isResetReg(reg):
+            self.reset = True
+        self.regs.append(reg)
+        shift = maskShift(mask)
+        if mask is None:
+            mask = 0xffffffff
+        word = self.words.get(address)
+        if word is None:
+            word = self.words[address] = [0, 0, False]
+            self.addresses.append(address)
+        word[0] |= mask
+        word[1] = (word[1] & ~mask) | ((value << shift) & mask)
+        word[2] = word[2] or readable
+
+    # returns the number of words written
+    def commit(self):
+        partial = [address for address in self.addresses if self.words[address][0] != 0xffffffff and self.words[address][2]]
+        shadowed = [] if shadow is None else [address for address in partial if address in shadow.words]
+        toRead = [address for address in partial if address not in shadowed]
+        if stats is not None:
+            for address in toRead: stats.countRmwRead(address)
+            for reg in self.regs: stats.countWrite(reg)
+        current = dict(zip(sorted(set(toRead)), readBlocks(makeBlocks(toRead))))
+        for address in shadowed:
+            current[address] = shadow.get(address)
+        for address in partial:
+            if isinstance(current[address], BusError):
+                raise current[address]
+        for address in self.addresses:
+            mask, value, readable = self.words[address]
+            if address in current:
+                value |= current[address] & ~mask
+            wReg(address, value)
+            if shadow is not None and readable:
+                shadow.update(address, value)
+        if shadow is not None and self.reset:
+            shadow.invalidate()
+        numWords = len(self.addresses)
+        self.discard()
+        return numWords
+
+    def discard(self):
+        self.words = {}
+        self.addresses = []
+        self.regs = []
+        self.reset = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        if excType is None:
+            self.commit()
+        else:
+            self.discard()
+        return False
+
+########## broadcast writes ##########
+
+# Writes one field on many instances of generated nodes without looking each of them up. The generate indices are
+# written as ${VAR} in the name and their ranges are given per variable, e.g. CFG_LATENCY of every VFAT on OH 0-11:
+#   broadcastWrite('GEM_AMC.OH.OH${OH}.GEB.VFAT${VFAT}.CFG_LATENCY', 45, OH=range(12), VFAT=range(24))
+# Only instances 0, 1 and the highest one of each variable are looked up: the addresses of consecutive instances are
+# generate_address_step apart, so all target addresses follow from those. The writes go out in one WriteTransaction.
+# overrides maps indices to a different value for that target: {(3, 7): 50} for OH3 VFAT7 (the indices are in the order
+# the variables appear in the name, and a plain index if there is only one variable).
+# Statistics count all the writes against instance 0.
+class Broadcast:
+
+    def __init__(self, pattern, **ranges):
+        self.vars = re.findall(r'\$\{(\w+)\}', pattern)
+        if len(self.vars) == 0 or len(set(self.vars)) != len(self.vars) or set(self.vars) != set(ranges.keys()):
+            raise ValueError('%s needs one range for each of its variables, got %s' % (pattern, ', '.join(sorted(ranges.keys()))))
+        zeros = dict((var, 0) for var in self.vars)
+        self.reg = getNode(substituteVars(pattern, zeros))
+        if self.reg is None:
+            raise ValueError('%s not found' % substituteVars(pattern, zeros))
+        checkWritable(self.reg)
+        ranges = [[ranges[var]] if isinstance(ranges[var], (int, long)) else sorted(set(ranges[var])) for var in self.vars]
+        steps = [self.getStep(pattern, var, indices) for var, indices in zip(self.vars, ranges)]
+        self.keys = [()]
+        addresses = [self.reg.real_address]
+        for indices, step in zip(ranges, steps):
+            self.keys = [key + (i,) for key in self.keys for i in indices]
+            addresses = [address + step*i for address in addresses for i in indices]
+        if len(self.vars) == 1:
+            self.keys = [key[0] for key in self.keys]
+        self.addresses = array.array('I', addresses)
+
+    # returns the address step between consecutive instances of the node generated by this variable
+    def getStep(self, pattern, var, indices):
+        if len(indices) == 0:
+            return 0
+        segs = pattern.split('.')
+        level = [i for i, seg in enumerate(segs) if '${' + var + '}' in seg][0]
+        prefix = '.'.join(segs[:level + 1])
+        def getInstance(i):
+            vars = dict((name, 0) for name in self.vars)
+            vars[var] = i
+            return getNode(substituteVars(prefix, vars))
+        first = getInstance(0)
+        last = getInstance(indices[-1])
+        if indices[0] < 0 or last is None:
+            raise ValueError('%s %d-%d is outside of the instances of %s' % (var, indices[0], indices[-1], prefix))
+        if indices[-1] == 0:
+            return 0
+        step = getInstance(1).real_address - first.real_address
+        if last.real_address != first.real_address + step * indices[-1]:
+            raise ValueError('The instances of %s are not generated with a constant address step' % prefix)
+        return step
+
+    def __len__(self):
+        return len(self.addresses)
+
+    # returns the number of words written
+    def write(self, value, overrides = None):
+        if overrides is None:
+            overrides = {}
+        unknown = set(overrides.keys()) - set(self.keys)
+        if len(unknown) > 0:
+            raise ValueError('Overrides for targets outside of the broadcast: %s' % ', '.join(str(key) for key in sorted(unknown)))
+        reg, mask, readable = self.reg, self.reg.mask, isReadable(self.reg)
+        transaction = WriteTransaction()
+        for key, address in zip(self.keys, self.addresses):
+            transaction.writeField(address, mask, overrides.get(key, value), readable, reg)
+        return transaction.commit()
+
+def broadcastWrite(pattern, value, overrides = None, **ranges):
+    return Broadcast(pattern, **ranges).write(value, overrides)
+
+########## concurrent access ##########
+
+# Slow control of different OHs goes over independent GBT links, so the transactions of several OHs can overlap instead
+# of waiting for each other. This code is Python 2, which has no asyncio, so the overlap comes from a pool of threads.
+# That only helps with the subprocess backend (the default), where the threads release the GIL while waiting for their
+# mpeek / mpoke processes. The mmap backend accesses the window word by word while holding the GIL, so the threads
+# run one after the other there (at no extra cost: those accesses take microseconds). Typically one task per OH:
+#   runConcurrently(configureOh, range(12))
+#   latencies = gatherReads([queryNodes('GEM_AMC.OH.OH%d.GEB.VFAT*.CFG_LATENCY' % oh) for oh in range(12)])
+
+CONCURRENT_THREADS = 12
+
+# calls function(arg) for each argument on up to numThreads threads, and returns the results in the order of the
+# arguments once all calls have finished; if any call raised, the exception of the first such argument is raised
+def runConcurrently(function, args, numThreads = None):
+    args = list(args)
+    if numThreads is None:
+        numThreads = CONCURRENT_THREADS
+    getBackend() # open it once, before the threads race for it
+    results = [None] * len(args)
+    errors = [None] * len(args)
+    tasks = Queue.Queue()
+    for i in xrange(len(args)):
+        tasks.put(i)
+    def work():
+        while True:
+            try: i = tasks.get_nowait()
+            except Queue.Empty: return
+            try: results[i] = function(args[i])
+            except: errors[i] = sys.exc_info()
+    threads = [threading.Thread(target=work) for i in xrange(min(numThreads, len(args)))]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for error in errors:
+        if error is not None:
+            raise error[0], error[1], error[2]
+    return results
+
+# reads each group of registers (a NodeSet or a list of readable registers) with its own ReadPlan, the groups concurrently,
+# and returns a list of values per group
+def gatherReads(groups, numThreads = None):
+    return runConcurrently(lambda group: group.read() if isinstance(group, NodeSet) else ReadPlan(group).read(), groups, numThreads)
+
+# commits the WriteTransactions concurrently, returns the number of words written by each
+def commitConcurrently(transactions, numThreads = None):
+    return runConcurrently(lambda transaction: transaction.commit(), transactions, numThreads)
+
+########## block access ##########
+
+# mode="block" nodes (e.g. the config blaster RAMs) are read and written as whole regions: the words are copied straight
+# between the bus and a buffer of 32bit words -- array('I') or a numpy uint32 array -- without a Python object per word.
+# offset and count are in words relative to the start of the block, count defaults to the rest of the block (or the buffer length)
+
+def getBlockRange(reg, buf, offset, count):
+    if reg.mode != 'block':
+        raise ValueError('%s is not a block node' % reg.name)
+    size = parseInt(reg.size)
+    if count is None:
+        count = size - offset
+        if buf is not None:
+            count = min(count, len(buf))
+    if int(offset) != offset or int(count) != count:
+        raise ValueError('The offset and count into %s must be whole words' % reg.name)
+    if offset < 0 or count < 0 or offset + count > size:
+        raise ValueError('Words %d to %d are outside of %s (%d words)' % (offset, offset + count - 1, reg.name, size))
+    if buf is not None and buf.itemsize != 4:
+        raise ValueError('The buffer must be an array of 32bit words')
+    if buf is not None and len(buf) < count:
+        raise ValueError('The buffer must hold at least %d words' % count)
+    return reg.real_address + 4*offset, count
+
+# returns the buffer (a new array('I') if none is given)
+def readBlock(reg, buf = None, offset = 0, count = None):
+    checkReadable(reg)
+    address, count = getBlockRange(reg, buf, offset, count)
+    if buf is None:
+        buf = array.array('I', [0]) * count
+    if count > 0:
+        if stats is not None: stats.time('readBlock', getBackend().readInto, address, buf, count)
+        else: getBackend().readInto(address, buf, count)
+    return buf
+
+# returns the number of words written
+def writeBlock(reg, buf, offset = 0, count = None):
+    checkWritable(reg)
+    address, count = getBlockRange(reg, buf, offset, count)
+    if count > 0:
+        if stats is not None: stats.time('writeBlock', getBackend().writeFrom, address, buf, count)
+        else: getBackend().writeFrom(address, buf, count)
+        if shadow is not None:
+            for shadowed in [a for a in shadow.words if address <= a < address + 4*count]:
+                shadow.invalidate(shadowed)
+    return count
+
+########## integer access ##########
+
+# readValue / writeValue work with plain field values instead of the formatted strings of readReg / writeReg, and raise
+# BusError or NoPermissionError instead of returning an error message, e.g.
+#   if readValue(getNode('GEM_AMC.OH_LINKS.OH0.GBT0_READY')) != 1: ...
+# readValues / writeValues are the same for a list of registers or a NodeSet, going through a ReadPlan / WriteTransaction.
+
+def readValue(reg):
+    checkReadable(reg)
+    if stats is not None: stats.countRead(reg)
+    value = rReg(reg.real_address)
+    if shadow is not None and isWritable(reg): shadow.update(reg.real_address, value)
+    if reg.mask is not None:
+        value = (reg.mask & value) >> maskShift(reg.mask)
+    return value
+
+# returns the full 32bit word written
+def writeValue(reg, value):
+    checkWritable(reg)
+    if value < 0 or value > (0xffffffff if reg.mask is None else reg.mask >> maskShift(reg.mask)):
+        raise ValueError('%d does not fit in %s' % (value, reg.name))
+    if stats is not None: stats.countWrite(reg)
+    word = mergeField(reg, value)
+    wReg(reg.real_address, word)
+    if shadow is not None: updateShadowAfterWrite(reg, word)
+    return word
+
+# returns the field values as an array in the order of the registers, raising the first BusError if any word failed
+def readValues(regs):
+    if isinstance(regs, NodeSet):
+        values = regs.read()
+    else:
+        for reg in regs:
+            checkReadable(reg)
+        values = ReadPlan(regs).read()
+    for value in values:
+        if isinstance(value, BusError):
+            raise value
+    return array.array('I', values)
+
+# writes one value to all registers, or one value per register, returns the number of words written
+def writeValues(regs, values):
+    if isinstance(regs, NodeSet):
+        return regs.write(values)
+    return NodeSet(list(regs)).write(values)
+
+# returns the 32bit word to write for this field value, with the other fields of the word preserved if it is readable
+def mergeField(reg, value):
+    if reg.mask is None:
+        return value
+    shifted_value = value << maskShift(reg.mask)
+    if 'r' not in reg.permission:
+        return shifted_value
+    # preserve the other fields sharing this 32bit word
+    initial_value = readWordForMerge(reg.real_address)
+    return (shifted_value & reg.mask) | (initial_value & ~reg.mask)
+
+# batch versions of readReg and displayReg, returning one string per register
+def readRegs(regs):
+    readable = [reg for reg in regs if isReadable(reg)]
+    values = iter(ReadPlan(readable).read())
+    ret = []
+    for reg in regs:
+        if not isReadable(reg): ret.append('No read permission!')
+        else:
+            value = next(values)
+            if isinstance(value, BusError): ret.append(str(value))
+            else: ret.append('{0:#010x}'.format(value))
+    return ret
+
+def displayRegs(regs, option=None):
+    readable = [reg for reg in regs if isReadable(reg)]
+    values = iter(ReadPlan(readable).read())
+    ret = []
+    for reg in regs:
+        if not isReadable(reg): ret.append('No read permission!')
+        else: ret.append(formatDisplay(reg, next(values), option))
+    return ret
+
+def formatDisplay(reg, value, option=None):
+    prefix = hex(reg.real_address).rstrip('L')+' '+reg.permission+'\t'+tabPad(reg.name,7)
+    if isinstance(value, BusError): return prefix+str(value)
+    if option=='hexbin': return prefix+'{0:#010x}'.format(value)+' = '+'{0:032b}'.format(value)
+    else: return prefix+'{0:#010x}'.format(value)
+
 
 def readAddress(address):
-    try: 
-        output = subprocess.check_output('mpeek '+str(address), stderr=subprocess.STDOUT , shell=True)
-        value = ''.join(s for s in output if s.isalnum())
-    except subprocess.CalledProcessError as e: value = parseError(int(str(e)[-1:]))
-    return '{0:#010x}'.format(parseInt(str(value)))
+    try: value = rReg(address)
+    except BusError as e: return str(e)
+    return '{0:#010x}'.format(value)
 
 def readRawAddress(raw_address):
     try: 
-        address = (parseInt(raw_address) << 2)+0x64000000
+        address = (parseInt(raw_address) << 2)+AXI_BASE_ADDRESS
         return readAddress(address)
     except:
         return 'Error reading address. (rw_reg)'
 
 def mpeek(address):
-    try: 
-        output = subprocess.check_output('mpeek '+str(address), stderr=subprocess.STDOUT , shell=True)
-        value = ''.join(s for s in output if s.isalnum())
-    except subprocess.CalledProcessError as e: value = parseError(int(str(e)[-1:]))
-    return value
+    try: return '{0:#010x}'.format(rReg(parseInt(address)))
+    except ValueError: return parseError(1)
+    except BusError as e: return str(e)
 
 def mpoke(address,value):
-    try: output = subprocess.check_output('mpoke '+str(address)+' '+str(value), stderr=subprocess.STDOUT , shell=True)
-    except subprocess.CalledProcessError as e: return parseError(int(str(e)[-1:]))
+    try: wReg(parseInt(address), parseInt(value))
+    except ValueError: return parseError(1)
+    except BusError as e: return str(e)
     return 'Done.'
 
 
 def readReg(reg):
-    address = reg.real_address
     if 'r' not in reg.permission:
         return 'No read permission!'
-    # mpeek
-    try: 
-        output = subprocess.check_output('mpeek '+str(address), stderr=subprocess.STDOUT , shell=True)
-        value = ''.join(s for s in output if s.isalnum())
-    except subprocess.CalledProcessError as e: return parseError(int(str(e)[-1:]))
-    # Apply Mask
-    if reg.mask is not None:
-        shift_amount=0
-        for bit in reversed('{0:b}'.format(reg.mask)):
-            if bit=='0': shift_amount+=1
-            else: break
-        final_value = (parseInt(str(reg.mask))&parseInt(value)) >> shift_amount
-    else: final_value = value
-    final_int =  parseInt(str(final_value))
-    return '{0:#010x}'.format(final_int)
+    try: return '{0:#010x}'.format(readValue(reg))
+    except BusError as e: return str(e)
 
 def displayReg(reg,option=None):
-    address = reg.real_address
     if 'r' not in reg.permission:
         return 'No read permission!'
-    # mpeek
-    try: 
-        output = subprocess.check_output('mpeek '+str(address), stderr=subprocess.STDOUT , shell=True)
-        value = ''.join(s for s in output if s.isalnum())
-    except subprocess.CalledProcessError as e: return hex(address).rstrip('L')+' '+reg.permission+'\t'+tabPad(reg.name,7)+parseError(int(str(e)[-1:]))
-    # Apply Mask
-    if reg.mask is not None:
-        shift_amount=0
-        for bit in reversed('{0:b}'.format(reg.mask)):
-            if bit=='0': shift_amount+=1
-            else: break
-        final_value = (parseInt(str(reg.mask))&parseInt(value)) >> shift_amount
-    else: final_value = value
-    final_int =  parseInt(str(final_value))
-
-    if option=='hexbin': return hex(address).rstrip('L')+' '+reg.permission+'\t'+tabPad(reg.name,7)+'{0:#010x}'.format(final_int)+' = '+'{0:032b}'.format(final_int)
-    else: return hex(address).rstrip('L')+' '+reg.permission+'\t'+tabPad(reg.name,7)+'{0:#010x}'.format(final_int)
+    try: value = readValue(reg)
+    except BusError as e: value = e
+    return formatDisplay(reg, value, option)
 
 def writeReg(reg, value):
     try: address = reg.real_address
@@ -201,42 +1638,36 @@ def writeReg(reg, value):
         return
     if 'w' not in reg.permission:
         return 'No write permission!'
+    if stats is not None: stats.countWrite(reg)
+
+    try: final_value = mergeField(reg, value)
+    except BusError as e: return 'Error reading initial value: '+str(e)
 
-    # Apply Mask if applicable
-    if reg.mask is not None:
-        shift_amount=0
-        for bit in reversed('{0:b}'.format(reg.mask)):
-            if bit=='0': shift_amount+=1
-            else: break
-        shifted_value = value << shift_amount
-        if 'r' not in reg.permission: final_value = shifted_value
-        else: 
-            initial_value = readReg(reg)
-            try: initial_value = parseInt(initial_value) 
-            except: return 'Error reading initial value: '+str(initial_value)
-            final_value = (shifted_value & reg.mask) | (initial_value & ~reg.mask)
-    else: final_value = value
-    
-    # mpoke
     try: 
-        output = subprocess.check_output('mpoke '+str(address)+' '+str(final_value), stderr=subprocess.STDOUT , shell=True)
+        wReg(address, final_value)
+        if shadow is not None: updateShadowAfterWrite(reg, final_value)
         return str('{0:#010x}'.format(final_value)).rstrip('L')+'('+str(value)+')\twritten to '+reg.name
-    except subprocess.CalledProcessError as e: return parseError(int(str(e)[-1:]))
+    except BusError as e: return str(e)
     
 
 
 def isValid(address):
-    try: subprocess.check_output('mpeek '+str(address), stderr=subprocess.STDOUT , shell=True)
-    except subprocess.CalledProcessError as e: return False
+    try: rReg(address)
+    except BusError: return False
     return True
 
 
 def completeReg(string):
-    possibleNodes = [] 
     completions = []
-    currentLevel = len([c for c in string if c=='.'])
-  
-    possibleNodes = [node for node in nodes if node.name.startswith(string) and node.level == currentLevel]
+    # walk down the tree to the parent of the segment being completed, then only look at its children
+    if '.' in string:
+        parent = getNode(string.rsplit('.',1)[0])
+        if parent is None: return completions
+        candidates = parent.children
+    else:
+        candidates = topNodes
+
+    possibleNodes = [node for node in candidates if node.name.startswith(string)]
     if len(possibleNodes)==1:
         if possibleNodes[0].children == []: return [possibleNodes[0].name]
         for n in possibleNodes[0].children:
@@ -278,5 +1709,8 @@ def substituteVars(string, vars):
 def tabPad(s,maxlen):
     return s+"\t"*((8*maxlen-len(s)-1)/8+1) 
 
+if os.environ.get('RW_REG_STATS'):
+    enableStats(os.environ['RW_REG_STATS'])
+
 if __name__ == '__main__':
     main()
@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+
+# Off-board benchmarks of the register access layer (rw_reg): address table parsing, lookups, register reads and writes
+# and replays of typical scripts, run against an emulated register space instead of a CTP7.
+# The results are written as JSON so that they can be compared between releases.
+#
+# Backends:
+#   memory      -- a dict holding one word for every address in the address table (other addresses give a bus error)
+#   file        -- rw_reg.FileBackend, i.e. the mmap code path on a sparse file instead of /dev/mem
+#   mmap        -- the real AXI window (only on a CTP7)
+#   subprocess  -- mpeek / mpoke (only where those are installed)
+
+import argparse
+import os, sys, time, json, random, shutil, tempfile
+import platform
+import rw_reg
+from rw_reg import *
+import config_vfats_minimal
+
+# emulates the AXI address space of the firmware: every address that has a node in the address table reads back the last value written
+class MemoryBackend:
+    name = 'memory'
+
+    def __init__(self, table):
+        self.words = dict.fromkeys(set(((address << 2) + AXI_BASE_ADDRESS) for address in table.address), 0)
+
+    def read(self, address):
+        if address not in self.words:
+            raise BusError(2)
+        return self.words[address]
+
+    def write(self, address, value):
+        if address not in self.words:
+            raise BusError(2)
+        self.words[address] = value & 0xffffffff
+
+    def readBlock(self, address, count):
+        return [self.read(address + 4*i) for i in xrange(count)]
+
+def makeBackend(name, tmpDir):
+    if name == 'memory':
+        return MemoryBackend(rw_reg.nodes)
+    if name == 'file':
+        return FileBackend(os.path.join(tmpDir, 'registers.bin'))
+    if name == 'mmap':
+        return MmapBackend()
+    if name == 'subprocess':
+        return SubprocessBackend()
+    raise ValueError('Unknown backend %s' % name)
+
+# runs the function the given number of times and returns the best and mean time of one run
+def measure(function, repeat):
+    times = []
+    for i in range(repeat):
+        start = time.time()
+        function()
+        times.append(time.time() - start)
+    return min(times), sum(times) / len(times)
+
+class Benchmark:
+
+    def __init__(self, repeat):
+        self.repeat = repeat
+        self.results = {}
+
+    # ops is the number of register operations (or lookups) done by one run of the function
+    def run(self, name, function, ops = 1, setup = None):
+        if setup is not None:
+            def timed():
+                setup()
+                function()
+        else: timed = function
+        best, mean = measure(timed, self.repeat)
+        self.results[name] = {'best': best, 'mean': mean, 'ops': ops, 'bestPerOp': best / ops, 'opsPerSecond': ops / best if best > 0 else None}
+        print '%-45s %10.3f ms %10.2f us/op' % (name, best * 1e3, best * 1e6 / ops)
+
+def benchmarkParsing(bench, filename, cacheDir):
+    rw_reg.ADDRESS_TABLE_CACHE_DIR = cacheDir
+    bench.run('parseXML.uncached', lambda: parseXML(filename, useCache=False))
+    parseXML(filename) # writes the cache
+    bench.run('parseXML.cached', lambda: parseXML(filename))
+    bench.run('parseXML.lazy', lambda: parseXML(filename, lazy=True))
+    bench.run('parseXML.lazy+getNode', lambda: (parseXML(filename, lazy=True), getNode('GEM_AMC.OH.OH3.GEB.VFAT7.VFAT_CHANNELS.CHANNEL12.MASK')))
+    parseXML(filename)
+
+def benchmarkLookups(bench, sampleSize):
+    names = [name for idx, name in rw_reg.nodes.iterNames()]
+    random.seed(0)
+    sample = random.sample(names, min(sampleSize, len(names)))
+    lookup = lambda: [getNode(name) for name in sample]
+    bench.run('getNode.cold', lookup, len(sample), rw_reg.nodesByName.clear)
+    bench.run('getNode.warm', lookup, len(sample))
+    bench.run('getNodesContaining', lambda: getNodesContaining('CFG_LATENCY'))
+    bench.run('queryNodes.glob', lambda: queryNodes('GEM_AMC.OH.OH*.GEB.VFAT*.CFG_LATENCY'), 1, rw_reg.nodeSets.clear)
+    bench.run('queryNodes.anyLevel', lambda: queryNodes('**.CFG_LATENCY'), 1, rw_reg.nodeSets.clear)
+    bench.run('getNodeFromAddress', lambda: [getNodeFromAddress(getNode(name).real_address) for name in sample[:1000]], min(1000, len(sample)))
+
+def getVfatRegs(ohN, vfatN):
+    regs = []
+    getAllChildren(getNode('GEM_AMC.OH.OH%d.GEB.VFAT%d' % (ohN, vfatN)), regs)
+    return regs
+
+# one channel of the testSbits.py injection loop (without the sleeps)
+def replayTestSbitsChannel(vfatN, ch, nInj):
+    addrSbitMonReset = getNode("GEM_AMC.TRIGGER.SBIT_MONITOR.RESET").real_address
+    addrTtcStart = getNode("GEM_AMC.TTC.GENERATOR.CYCLIC_START").real_address
+    addrCluster = [getNode("GEM_AMC.TRIGGER.SBIT_MONITOR.CLUSTER%i"%i).real_address for i in range(8)]
+    writeReg(getNode("GEM_AMC.OH.OH0.GEB.VFAT%i.VFAT_CHANNELS.CHANNEL%i"%(vfatN,ch)), 0x8000)
+    writeReg(getNode("GEM_AMC.GEM_TESTS.VFAT_DAQ_MONITOR.CTRL.RESET"), 1)
+    writeReg(getNode("GEM_AMC.GEM_TESTS.VFAT_DAQ_MONITOR.CTRL.VFAT_CHANNEL_SELECT"), ch)
+    writeReg(getNode("GEM_AMC.TRIGGER.CTRL.CNT_RESET"), 1)
+    readValue(getNode("GEM_AMC.TRIGGER.OH0.TRIGGER_CNT"))
+    for inj in range(nInj):
+        wReg(addrSbitMonReset, 1)
+        wReg(addrTtcStart, 1)
+        for cluster in range(8):
+            rReg(addrCluster[cluster])
+    readValue(getNode("GEM_AMC.GEM_TESTS.VFAT_DAQ_MONITOR.VFAT%i.GOOD_EVENTS_COUNT"%vfatN))
+    readValue(getNode("GEM_AMC.GEM_TESTS.VFAT_DAQ_MONITOR.VFAT%i.CHANNEL_FIRE_COUNT"%vfatN))
+    writeReg(getNode("GEM_AMC.OH.OH0.GEB.VFAT%i.VFAT_CHANNELS.CHANNEL%i"%(vfatN,ch)), 0x4000)
+
+def benchmarkBackend(bench, backendName, tmpDir, reps):
+    setBackend(makeBackend(backendName, tmpDir))
+    prefix = 'backend.%s.' % backendName
+    vfatRegs = getVfatRegs(0, 0)
+    readable = [reg for reg in vfatRegs if isReadable(reg)]
+    writable = [reg for reg in vfatRegs if isWritable(reg)]
+    address = readable[0].real_address
+
+    bench.run(prefix + 'rReg', lambda: [rReg(address) for i in xrange(reps)], reps)
+    bench.run(prefix + 'wReg', lambda: [wReg(address, i) for i in xrange(reps)], reps)
+    bench.run(prefix + 'readReg', lambda: [readReg(reg) for reg in readable], len(readable))
+    bench.run(prefix + 'writeReg', lambda: [writeReg(reg, 1) for reg in writable], len(writable))
+    bench.run(prefix + 'readGroup.readReg', lambda: [displayReg(reg) for reg in readable], len(readable))
+    bench.run(prefix + 'readGroup.displayRegs', lambda: displayRegs(readable), len(readable))
+    plan = ReadPlan(readable)
+    bench.run(prefix + 'readGroup.ReadPlan', plan.read, len(readable))
+    bench.run(prefix + 'configureVfat', lambda: config_vfats_minimal.configureVfat(0, 0))
+    bench.run(prefix + 'testSbits.channel', lambda: replayTestSbitsChannel(0, 0, 100))
+    setBackend(None)
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks rw_reg off-board against an emulated register space.')
+    parser.add_argument('-x', metavar='address_table', default=ADDRESS_TABLE_TOP,
+                   help='Optional: address table XML file (default %s)' % ADDRESS_TABLE_TOP)
+    parser.add_argument('-b', metavar='backends', default='memory,file',
+                   help='Optional: comma separated list of backends to benchmark: memory, file, mmap, subprocess (default memory,file)')
+    parser.add_argument('-r', metavar='repeat', type=int, default=3,
+                   help='Optional: number of runs of each benchmark, the best one is reported (default 3)')
+    parser.add_argument('-n', metavar='ops', type=int, default=10000,
+                   help='Optional: number of raw accesses and lookups per run (default 10000)')
+    parser.add_argument('-o', metavar='output_file', default='rw_reg_benchmark.json',
+                   help='Optional: JSON file for the results (default rw_reg_benchmark.json)')
+    parser.add_argument('-skip_parse', action='store_true',
+                   help='Optional: don\'t benchmark parsing the address table')
+    args = parser.parse_args()
+
+    bench = Benchmark(args.r)
+    tmpDir = tempfile.mkdtemp(prefix='rw_reg_benchmark')
+    try:
+        if not args.skip_parse:
+            benchmarkParsing(bench, args.x, tmpDir)
+        else:
+            rw_reg.ADDRESS_TABLE_CACHE_DIR = tmpDir
+            parseXML(args.x)
+        benchmarkLookups(bench, args.n)
+        for backendName in args.b.split(','):
+            benchmarkBackend(bench, backendName, tmpDir, args.n)
+    finally:
+        shutil.rmtree(tmpDir)
+
+    report = {'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+              'host': platform.node(),
+              'python': platform.python_version(),
+              'addressTable': os.path.abspath(args.x),
+              'numNodes': len(rw_reg.nodes),
+              'repeat': args.r,
+              'results': bench.results}
+    f = open(args.o, 'w')
+    json.dump(report, f, indent=2, sort_keys=True)
+    f.close()
+    print 'Results written to', args.o
+
+if __name__ == '__main__':
+    main()
@@ -148,7 +148,7 @@ if __name__ == '__main__':
 	    writeReg(getNode("GEM_AMC.GEM_TESTS.VFAT_DAQ_MONITOR.CTRL.VFAT_CHANNEL_SELECT"),ch)
             writeReg(getNode("GEM_AMC.TRIGGER.CTRL.CNT_RESET"), 1)
             time.sleep(NOISE_CHECK_SLEEP)
-            nNoiseClusters[ch] = int(readReg(getNode("GEM_AMC.TRIGGER.OH0.TRIGGER_CNT")), 0)
+            nNoiseClusters[ch] = readValue(getNode("GEM_AMC.TRIGGER.OH0.TRIGGER_CNT"))
             if (nNoiseClusters[ch] > 0):
                 print "!!! This channel saw %i clusters in %f ms without pulsing!!!" % (nNoiseClusters[ch], NOISE_CHECK_SLEEP * 1000) 
 
@@ -195,8 +195,8 @@ if __name__ == '__main__':
                 clusterSet[clusterVal] += 1
                 pass
 
-            goodEv = int(readReg(getNode("GEM_AMC.GEM_TESTS.VFAT_DAQ_MONITOR.VFAT%i.GOOD_EVENTS_COUNT"%vfatN)), 0)
-            fireEv = int(readReg(getNode("GEM_AMC.GEM_TESTS.VFAT_DAQ_MONITOR.VFAT%i.CHANNEL_FIRE_COUNT"%vfatN)), 0)
+            goodEv = readValue(getNode("GEM_AMC.GEM_TESTS.VFAT_DAQ_MONITOR.VFAT%i.GOOD_EVENTS_COUNT"%vfatN))
+            fireEv = readValue(getNode("GEM_AMC.GEM_TESTS.VFAT_DAQ_MONITOR.VFAT%i.CHANNEL_FIRE_COUNT"%vfatN))
 
 	    nDAQ[ch] = fireEv
 
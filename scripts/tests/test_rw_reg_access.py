@@ -0,0 +1,349 @@
+# WriteTransaction, ReadPlan, queryNodes, Broadcast, readValue / writeValue and the shadow cache against a FileBackend on a
+# sparse temporary file, run with
+#   python -m unittest discover scripts/tests
+
+import os, sys, shutil, tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import rw_reg
+from rw_reg import AXI_BASE_ADDRESS, Broadcast, BusError, FileBackend, NoPermissionError, ReadPlan, WriteTransaction
+from rw_reg import broadcastWrite, disableShadow, enableShadow, getNode, getNodesContaining, getRegsContaining, parseXML
+from rw_reg import queryNodes, readValue, readValues, setBackend, writeValue
+
+ADDRESS_TABLE = '''<?xml version="1.0" encoding="utf-8"?>
+<node id="top">
+  <node id="GEM_AMC" address="0x0">
+    <node id="CTRL" address="0x10">
+      <node id="ENABLE" address="0x0" mask="0x00000001" permission="rw"/>
+      <node id="MODE" address="0x0" mask="0x000000f0" permission="rw"/>
+      <node id="MODULE_RESET" address="0x1" permission="w"/>
+      <node id="PULSE" address="0x2" mask="0x0000ff00" permission="w"/>
+      <node id="STATUS" address="0x3" mask="0xffff0000" permission="r"/>
+      <node id="WORD" address="0x4" permission="rw"/>
+    </node>
+    <node id="OH${OH_IDX}" address="0x1000" generate="true" generate_size="4" generate_address_step="0x100" generate_idx_var="OH_IDX">
+      <node id="VFAT${VFAT_IDX}" address="0x0" generate="true" generate_size="3" generate_address_step="0x10" generate_idx_var="VFAT_IDX">
+        <node id="CFG_RUN" address="0x0" mask="0x00000001" permission="rw"/>
+        <node id="CFG_LATENCY" address="0x1" mask="0x000003ff" permission="rw"/>
+        <node id="CFG_PULSE_STRETCH" address="0x1" mask="0x00007000" permission="rw"/>
+      </node>
+      <node id="CLUSTER_RATE" address="0x80" permission="r"/>
+      <node id="CLUSTER_SIZE" address="0x81" mask="0x0000000f" permission="r"/>
+    </node>
+    <node id="UNEVEN0" address="0x2000">
+      <node id="WORD" address="0x0" permission="rw"/>
+    </node>
+    <node id="UNEVEN1" address="0x2010">
+      <node id="WORD" address="0x0" permission="rw"/>
+    </node>
+    <node id="UNEVEN2" address="0x2030">
+      <node id="WORD" address="0x0" permission="rw"/>
+    </node>
+    <node id="EDGE" address="0x3ffe">
+      <node id="A" address="0x0" permission="r"/>
+      <node id="B" address="0x1" mask="0x0000ff00" permission="r"/>
+      <node id="C" address="0x2" permission="r"/>
+      <node id="D" address="0x3" mask="0x000000ff" permission="rw"/>
+    </node>
+  </node>
+</node>
+'''
+
+WINDOW_SIZE = 0x10000 # words 0 to 0x3fff, so EDGE.C and EDGE.D are outside of it and raise BusError
+
+# records the bus accesses as ('read' | 'write' | 'readBlock', address[, value or count])
+class RecordingBackend(FileBackend):
+
+    def __init__(self, filename):
+        FileBackend.__init__(self, filename, size = WINDOW_SIZE)
+        self.log = []
+
+    def read(self, address):
+        self.log.append(('read', address))
+        return FileBackend.read(self, address)
+
+    def write(self, address, value):
+        self.log.append(('write', address, value))
+        FileBackend.write(self, address, value)
+
+    def readBlock(self, address, count):
+        self.log.append(('readBlock', address, count))
+        return FileBackend.readBlock(self, address, count)
+
+    def accesses(self, kind):
+        return [entry[1:] for entry in self.log if entry[0] == kind]
+
+def realAddress(address):
+    return AXI_BASE_ADDRESS + (address << 2)
+
+class AccessTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        table = os.path.join(self.dir, 'table.xml')
+        f = open(table, 'w')
+        f.write(ADDRESS_TABLE)
+        f.close()
+        parseXML(table, useCache = False)
+        self.backend = RecordingBackend(os.path.join(self.dir, 'window.bin'))
+        setBackend(self.backend)
+
+    def tearDown(self):
+        disableShadow()
+        setBackend(None)
+        self.backend.mem.close()
+        shutil.rmtree(self.dir)
+
+    # sets words without recording it
+    def poke(self, address, value):
+        FileBackend.write(self.backend, realAddress(address), value)
+
+    def peek(self, address):
+        return FileBackend.read(self.backend, realAddress(address))
+
+class WriteTransactionTest(AccessTest):
+
+    def testMergesFieldsOfAWord(self):
+        self.poke(0x10, 0xabcd0000)
+        t = WriteTransaction()
+        t.write(getNode('GEM_AMC.CTRL.ENABLE'), 1)
+        t.write(getNode('GEM_AMC.CTRL.MODE'), 0x5)
+        self.assertEqual(self.backend.log, [])
+        self.assertEqual(t.commit(), 1)
+        # one read for the bits that were not written, one write of the merged word
+        self.assertEqual(self.backend.accesses('readBlock'), [(realAddress(0x10), 1)])
+        self.assertEqual(self.backend.accesses('write'), [(realAddress(0x10), 0xabcd0051)])
+
+    def testLastWriteOfAFieldWins(self):
+        t = WriteTransaction()
+        t.write(getNode('GEM_AMC.CTRL.MODE'), 0x5)
+        t.write(getNode('GEM_AMC.CTRL.MODE'), 0x3)
+        t.commit()
+        self.assertEqual(self.peek(0x10), 0x30)
+
+    def testFirstTouchOrder(self):
+        # CFG_RUN is touched last, so its word is written last even if fields of the other words come after it
+        t = WriteTransaction()
+        t.write(getNode('GEM_AMC.OH0.VFAT1.CFG_LATENCY'), 45)
+        t.write(getNode('GEM_AMC.OH0.VFAT0.CFG_LATENCY'), 44)
+        t.write(getNode('GEM_AMC.OH0.VFAT0.CFG_RUN'), 1)
+        t.write(getNode('GEM_AMC.OH0.VFAT1.CFG_PULSE_STRETCH'), 3)
+        t.write(getNode('GEM_AMC.OH0.VFAT0.CFG_PULSE_STRETCH'), 2)
+        self.assertEqual(t.commit(), 3)
+        self.assertEqual([address for address, value in self.backend.accesses('write')],
+                         [realAddress(0x1011), realAddress(0x1001), realAddress(0x1000)])
+        self.assertEqual(self.peek(0x1011), (3 << 12) | 45)
+        self.assertEqual(self.peek(0x1001), (2 << 12) | 44)
+        self.assertEqual(self.peek(0x1000), 1)
+
+    def testReadsAreCoalescedBeforeTheWrites(self):
+        t = WriteTransaction()
+        for vfat in range(3):
+            t.write(getNode('GEM_AMC.OH1.VFAT%d.CFG_RUN' % vfat), 1)
+        t.write(getNode('GEM_AMC.CTRL.ENABLE'), 1)
+        t.commit()
+        kinds = [entry[0] for entry in self.backend.log]
+        self.assertEqual(kinds, ['readBlock'] * 4 + ['write'] * 4)
+
+    def testNoReadForWholeOrWriteOnlyWords(self):
+        self.poke(0x12, 0x12345678)
+        t = WriteTransaction()
+        t.write(getNode('GEM_AMC.CTRL.WORD'), 0xdeadbeef)
+        t.write(getNode('GEM_AMC.CTRL.MODULE_RESET'), 1)
+        # write-only, so the other bits can't be read back: they are written as 0
+        t.write(getNode('GEM_AMC.CTRL.PULSE'), 0xff)
+        t.commit()
+        self.assertEqual(self.backend.accesses('readBlock') + self.backend.accesses('read'), [])
+        self.assertEqual(self.backend.accesses('write'), [(realAddress(0x14), 0xdeadbeef), (realAddress(0x11), 1), (realAddress(0x12), 0xff00)])
+
+    def testPermission(self):
+        t = WriteTransaction()
+        self.assertRaises(NoPermissionError, t.write, getNode('GEM_AMC.CTRL.STATUS'), 1)
+
+    def testBusErrorOnTheMergeReadWritesNothing(self):
+        t = WriteTransaction()
+        t.write(getNode('GEM_AMC.CTRL.ENABLE'), 1)
+        t.write(getNode('GEM_AMC.EDGE.D'), 1)
+        self.assertRaises(BusError, t.commit)
+        self.assertEqual(self.backend.accesses('write'), [])
+
+    def testContextManager(self):
+        with WriteTransaction() as t:
+            t.write(getNode('GEM_AMC.CTRL.WORD'), 7)
+        self.assertEqual(self.peek(0x14), 7)
+        try:
+            with WriteTransaction() as t:
+                t.write(getNode('GEM_AMC.CTRL.WORD'), 8)
+                raise KeyError('abort')
+        except KeyError:
+            pass
+        self.assertEqual(self.peek(0x14), 7)
+
+    def testNodeSetWrite(self):
+        latencies = queryNodes('GEM_AMC.OH2.VFAT*.CFG_LATENCY')
+        self.assertEqual(latencies.write(100), 3)
+        self.assertEqual(list(latencies.read()), [100, 100, 100])
+        self.assertEqual(latencies.write([1, 2, 3]), 3)
+        self.assertEqual(list(latencies.read()), [1, 2, 3])
+
+class ReadPlanTest(AccessTest):
+
+    def testCoalescesWords(self):
+        self.poke(0x1001, (5 << 12) | 300)
+        self.poke(0x1000, 1)
+        regs = [getNode('GEM_AMC.OH0.VFAT0.CFG_PULSE_STRETCH'), getNode('GEM_AMC.OH0.VFAT0.CFG_RUN'), getNode('GEM_AMC.OH0.VFAT0.CFG_LATENCY')]
+        plan = ReadPlan(regs)
+        self.assertEqual(plan.numWords, 2)
+        self.assertEqual(list(plan.read()), [5, 1, 300])
+        # both words in one block, read once
+        self.assertEqual(self.backend.log, [('readBlock', realAddress(0x1000), 2)])
+
+    def testBlocksOfConsecutiveWords(self):
+        regs = list(queryNodes('GEM_AMC.OH3.**').readable())
+        plan = ReadPlan(regs)
+        # the words of the 3 VFATs (0x10 apart) and the two cluster words
+        self.assertEqual(plan.blocks, [[realAddress(0x1300), 2], [realAddress(0x1310), 2], [realAddress(0x1320), 2], [realAddress(0x1380), 2]])
+        plan.read()
+        self.assertEqual(len(self.backend.accesses('readBlock')), 4)
+
+    def testBusErrorNarrowedToTheFailingWords(self):
+        self.poke(0x3ffe, 0x11)
+        self.poke(0x3fff, 0x2200)
+        values = list(ReadPlan([getNode('GEM_AMC.EDGE.%s' % name) for name in 'ABCD']).read())
+        self.assertEqual(values[:2], [0x11, 0x22])
+        self.assertTrue(isinstance(values[2], BusError))
+        self.assertTrue(isinstance(values[3], BusError))
+        # the block failed as a whole, then every word was read on its own
+        self.assertEqual(self.backend.accesses('readBlock'), [(realAddress(0x3ffe), 4)])
+        self.assertEqual(self.backend.accesses('read'), [(realAddress(address),) for address in range(0x3ffe, 0x4002)])
+
+    def testReadValuesRaisesTheBusError(self):
+        self.assertRaises(BusError, readValues, [getNode('GEM_AMC.EDGE.A'), getNode('GEM_AMC.EDGE.C')])
+        self.assertRaises(NoPermissionError, readValues, [getNode('GEM_AMC.CTRL.MODULE_RESET')])
+
+class QueryNodesTest(AccessTest):
+
+    def names(self, regs):
+        return [reg.name for reg in regs]
+
+    def testGlobMatchesSubstringFilter(self):
+        self.assertEqual(self.names(queryNodes('GEM_AMC.OH*.VFAT*.CFG_LATENCY')), self.names(getNodesContaining('CFG_LATENCY')))
+        self.assertEqual(self.names(queryNodes('**.CLUSTER*')), self.names(getNodesContaining('CLUSTER')))
+        self.assertEqual(self.names(queryNodes('GEM_AMC.OH1.**')), self.names(getNodesContaining('GEM_AMC.OH1')))
+        self.assertEqual(len(queryNodes('GEM_AMC.OH*.VFAT*.CFG_LATENCY')), 12)
+
+    def testReadableMatchesGetRegsContaining(self):
+        self.assertEqual(self.names(queryNodes('GEM_AMC.CTRL.*').readable()), self.names(getRegsContaining('GEM_AMC.CTRL.')))
+        self.assertEqual(self.names(queryNodes('**.OH2.**').readable()), self.names(getRegsContaining('OH2.')))
+
+    def testRegex(self):
+        self.assertEqual(self.names(queryNodes(r'GEM_AMC\.OH[0-9]+\.VFAT1\.CFG_.*', regex = True)), self.names(getNodesContaining('.VFAT1.CFG_')))
+        # the whole name has to match
+        self.assertEqual(self.names(queryNodes(r'GEM_AMC\.OH1\.VFAT1', regex = True)), ['GEM_AMC.OH1.VFAT1'])
+
+    def testWildcards(self):
+        self.assertEqual(self.names(queryNodes('GEM_AMC.OH[02].VFAT?.CFG_RUN')),
+                         ['GEM_AMC.OH%d.VFAT%d.CFG_RUN' % (oh, vfat) for oh in (0, 2) for vfat in range(3)])
+        self.assertEqual(self.names(queryNodes('GEM_AMC.CTRL')), ['GEM_AMC.CTRL'])
+        self.assertEqual(len(queryNodes('GEM_AMC.NOTHING.*')), 0)
+        self.assertEqual(getNodesContaining('NOTHING'), None)
+
+    def testCached(self):
+        self.assertTrue(queryNodes('**.CFG_RUN') is queryNodes('**.CFG_RUN'))
+
+class BroadcastTest(AccessTest):
+
+    def testAddresses(self):
+        broadcast = Broadcast('GEM_AMC.OH${OH}.VFAT${VFAT}.CFG_LATENCY', OH = range(4), VFAT = range(3))
+        self.assertEqual(len(broadcast), 12)
+        self.assertEqual(list(broadcast.addresses), [realAddress(0x1001 + 0x100*oh + 0x10*vfat) for oh in range(4) for vfat in range(3)])
+        self.assertEqual(broadcast.keys, [(oh, vfat) for oh in range(4) for vfat in range(3)])
+        self.assertEqual(list(Broadcast('GEM_AMC.OH${OH}.VFAT${VFAT}.CFG_RUN', OH = [3, 1], VFAT = 2).addresses),
+                         [realAddress(0x1120), realAddress(0x1320)])
+
+    def testAddressesMatchTheNodes(self):
+        broadcast = Broadcast('GEM_AMC.OH${OH}.VFAT${VFAT}.CFG_PULSE_STRETCH', OH = [0, 2, 3], VFAT = [1, 2])
+        self.assertEqual(list(broadcast.addresses), [getNode('GEM_AMC.OH%d.VFAT%d.CFG_PULSE_STRETCH' % key).real_address for key in broadcast.keys])
+
+    def testWrite(self):
+        self.poke(0x1201, 0x3ff)
+        self.assertEqual(broadcastWrite('GEM_AMC.OH${OH}.VFAT${VFAT}.CFG_PULSE_STRETCH', 7, {(2, 0): 1}, OH = range(4), VFAT = range(3)), 12)
+        self.assertEqual(len(self.backend.accesses('write')), 12)
+        for oh in range(4):
+            for vfat in range(3):
+                self.assertEqual(readValue(getNode('GEM_AMC.OH%d.VFAT%d.CFG_PULSE_STRETCH' % (oh, vfat))), 1 if (oh, vfat) == (2, 0) else 7)
+        # the other field of the word is kept
+        self.assertEqual(readValue(getNode('GEM_AMC.OH2.VFAT0.CFG_LATENCY')), 0x3ff)
+        # nothing else was written
+        self.assertEqual(self.peek(0x1000), 0)
+        self.assertEqual(self.peek(0x1080), 0)
+
+    def testErrors(self):
+        self.assertRaises(ValueError, Broadcast, 'GEM_AMC.OH${OH}.VFAT${VFAT}.CFG_RUN', OH = range(4))
+        self.assertRaises(ValueError, Broadcast, 'GEM_AMC.OH${OH}.VFAT0.CFG_RUN', OH = range(4), VFAT = range(3))
+        self.assertRaises(ValueError, Broadcast, 'GEM_AMC.OH${OH}.VFAT0.CFG_RUN', OH = range(5))
+        self.assertRaises(ValueError, Broadcast, 'GEM_AMC.OH${OH}.VFAT0.NOTHING', OH = range(4))
+        self.assertRaises(NoPermissionError, Broadcast, 'GEM_AMC.OH${OH}.CLUSTER_RATE', OH = range(4))
+        # the steps are only checked from the first, second and last instance
+        self.assertRaises(ValueError, Broadcast, 'GEM_AMC.UNEVEN${I}.WORD', I = range(3))
+        self.assertRaises(ValueError, Broadcast('GEM_AMC.OH${OH}.VFAT0.CFG_RUN', OH = range(4)).write, 1, {5: 0})
+
+class ValueAccessTest(AccessTest):
+
+    def testReadValue(self):
+        self.poke(0x13, 0xbeef1234)
+        self.poke(0x1381, 0xfffffff5)
+        self.assertEqual(readValue(getNode('GEM_AMC.CTRL.STATUS')), 0xbeef)
+        self.assertEqual(readValue(getNode('GEM_AMC.OH3.CLUSTER_SIZE')), 5)
+
+    def testWriteValue(self):
+        self.poke(0x10, 0xffffff00)
+        self.assertEqual(writeValue(getNode('GEM_AMC.CTRL.MODE'), 0xa), 0xffffffa0)
+        self.assertEqual(self.peek(0x10), 0xffffffa0)
+        self.assertEqual(writeValue(getNode('GEM_AMC.CTRL.WORD'), 0xffffffff), 0xffffffff)
+
+    def testErrors(self):
+        self.assertRaises(NoPermissionError, readValue, getNode('GEM_AMC.CTRL.MODULE_RESET'))
+        self.assertRaises(NoPermissionError, writeValue, getNode('GEM_AMC.CTRL.STATUS'), 1)
+        self.assertRaises(NoPermissionError, readValue, getNode('GEM_AMC.CTRL'))
+        # NoPermissionError is a ValueError, for the callers that already catch those
+        self.assertTrue(issubclass(NoPermissionError, ValueError))
+        self.assertRaises(ValueError, writeValue, getNode('GEM_AMC.CTRL.MODE'), 0x10)
+        self.assertRaises(ValueError, writeValue, getNode('GEM_AMC.CTRL.MODE'), -1)
+        self.assertRaises(ValueError, writeValue, getNode('GEM_AMC.CTRL.WORD'), 0x100000000)
+        self.assertRaises(BusError, readValue, getNode('GEM_AMC.EDGE.C'))
+        self.assertRaises(BusError, writeValue, getNode('GEM_AMC.EDGE.D'), 1)
+        self.assertEqual(self.backend.accesses('write'), [])
+
+class ShadowTest(AccessTest):
+
+    def testMergeUsesTheShadow(self):
+        enableShadow()
+        self.poke(0x10, 0xabcd0000)
+        writeValue(getNode('GEM_AMC.CTRL.ENABLE'), 1)
+        writeValue(getNode('GEM_AMC.CTRL.MODE'), 3)
+        # only the first merge read the word
+        self.assertEqual(len(self.backend.accesses('read')), 1)
+        self.assertEqual(self.peek(0x10), 0xabcd0031)
+        with WriteTransaction() as t:
+            t.write(getNode('GEM_AMC.CTRL.MODE'), 4)
+        self.assertEqual(len(self.backend.accesses('read')) + len(self.backend.accesses('readBlock')), 1)
+        self.assertEqual(self.peek(0x10), 0xabcd0041)
+
+    def testResetDropsTheShadow(self):
+        shadow = enableShadow()
+        writeValue(getNode('GEM_AMC.CTRL.ENABLE'), 1)
+        self.assertTrue(realAddress(0x10) in shadow.words)
+        writeValue(getNode('GEM_AMC.CTRL.MODULE_RESET'), 1)
+        self.assertEqual(shadow.words, {})
+
+    def testVerify(self):
+        shadow = enableShadow()
+        writeValue(getNode('GEM_AMC.CTRL.ENABLE'), 1)
+        self.poke(0x10, 0x20)
+        self.assertEqual(rw_reg.verifyShadow(), [realAddress(0x10)])
+        self.assertEqual(shadow.words[realAddress(0x10)], 0x20)
+
+if __name__ == '__main__':
+    unittest.main()
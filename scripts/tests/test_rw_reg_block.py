@@ -0,0 +1,122 @@
+# readBlock / writeBlock against a FileBackend on a sparse temporary file, run with
+#   python -m unittest discover scripts/tests
+
+import os, sys, shutil, tempfile, array
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import rw_reg
+from rw_reg import FileBackend, NoPermissionError, getNode, parseXML, readBlock, setBackend, writeBlock
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+ADDRESS_TABLE = '''<?xml version="1.0" encoding="utf-8"?>
+<node id="top">
+  <node id="GEM_AMC" address="0x0">
+    <node id="RAM" address="0x100" mode="block" size="16" permission="rw"/>
+    <node id="RAM_RO" address="0x200" mode="block" size="4" permission="r"/>
+    <node id="CTRL" address="0x300" mask="0xffffffff" permission="rw"/>
+  </node>
+</node>
+'''
+
+WINDOW_SIZE = 0x10000
+
+class BlockAccessTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        table = os.path.join(self.dir, 'table.xml')
+        f = open(table, 'w')
+        f.write(ADDRESS_TABLE)
+        f.close()
+        parseXML(table, useCache = False)
+        self.backend = FileBackend(os.path.join(self.dir, 'window.bin'), size = WINDOW_SIZE)
+        setBackend(self.backend)
+        self.ram = getNode('GEM_AMC.RAM')
+
+    def tearDown(self):
+        setBackend(None)
+        self.backend.mem.close()
+        shutil.rmtree(self.dir)
+
+    def testWriteThenRead(self):
+        data = array.array('I', [0xdeadbeef + i for i in range(16)])
+        self.assertEqual(writeBlock(self.ram, data), 16)
+        self.assertEqual(readBlock(self.ram), data)
+        # the words are at the addresses of the block in the window
+        self.assertEqual(self.backend.read(self.ram.real_address + 4*15), 0xdeadbeef + 15)
+
+    def testOffsetAndCount(self):
+        writeBlock(self.ram, array.array('I', [0] * 16))
+        self.assertEqual(writeBlock(self.ram, array.array('I', [1, 2, 3, 4]), offset = 5, count = 3), 3)
+        self.assertEqual(list(readBlock(self.ram)), [0] * 5 + [1, 2, 3] + [0] * 8)
+        self.assertEqual(list(readBlock(self.ram, offset = 4, count = 5)), [0, 1, 2, 3, 0])
+        # count defaults to the rest of the block, capped by the buffer length
+        buf = array.array('I', [0xffffffff] * 4)
+        self.assertTrue(readBlock(self.ram, buf, offset = 6) is buf)
+        self.assertEqual(list(buf), [2, 3, 0, 0])
+        self.assertEqual(len(readBlock(self.ram, offset = 12)), 4)
+
+    def testOutOfRange(self):
+        buf = array.array('I', [0] * 32)
+        self.assertRaises(ValueError, readBlock, self.ram, None, 0, 17)
+        self.assertRaises(ValueError, readBlock, self.ram, None, 15, 2)
+        self.assertRaises(ValueError, readBlock, self.ram, None, 17)
+        self.assertRaises(ValueError, readBlock, self.ram, None, -1)
+        self.assertRaises(ValueError, readBlock, self.ram, None, 0, -1)
+        self.assertRaises(ValueError, writeBlock, self.ram, buf, 0, 17)
+        self.assertRaises(ValueError, writeBlock, self.ram, buf, 8, 9)
+        self.assertRaises(ValueError, writeBlock, self.ram, buf, 16, 1)
+        # the buffer is too short for the requested count
+        self.assertRaises(ValueError, readBlock, self.ram, array.array('I', [0] * 4), 0, 8)
+        self.assertRaises(ValueError, writeBlock, self.ram, array.array('I', [0] * 4), 0, 8)
+
+    def testMisaligned(self):
+        # offsets and counts that are not whole words, and buffers of other than 32bit words
+        self.assertRaises(ValueError, readBlock, self.ram, None, 0.5, 2)
+        self.assertRaises(ValueError, readBlock, self.ram, None, 0, 1.25)
+        self.assertRaises(ValueError, writeBlock, self.ram, array.array('I', [0] * 4), 2.5)
+        self.assertRaises(ValueError, readBlock, self.ram, array.array('H', [0] * 16))
+        self.assertRaises(ValueError, writeBlock, self.ram, array.array('B', [0] * 64))
+        self.assertRaises(ValueError, writeBlock, self.ram, array.array('d', [0] * 16))
+        # byte addresses that are not on a word boundary never reach the window
+        self.assertRaises(rw_reg.BusError, self.backend.readInto, self.ram.real_address + 2, array.array('I', [0] * 4), 4)
+        self.assertRaises(rw_reg.BusError, self.backend.writeFrom, self.ram.real_address + 1, array.array('I', [0] * 4), 4)
+
+    def testNotABlock(self):
+        self.assertRaises(ValueError, readBlock, getNode('GEM_AMC.CTRL'))
+        self.assertRaises(NoPermissionError, writeBlock, getNode('GEM_AMC.RAM_RO'), array.array('I', [0] * 4))
+
+    @unittest.skipIf(numpy is None, 'numpy is not installed')
+    def testNumpy(self):
+        data = numpy.arange(16, dtype = numpy.uint32) * 0x01010101
+        self.assertEqual(writeBlock(self.ram, data), 16)
+        buf = numpy.zeros(16, dtype = numpy.uint32)
+        self.assertTrue(readBlock(self.ram, buf) is buf)
+        self.assertTrue(numpy.array_equal(buf, data))
+        self.assertEqual(list(readBlock(self.ram)), list(data))
+        self.assertRaises(ValueError, readBlock, self.ram, numpy.zeros(16, dtype = numpy.uint16))
+        self.assertRaises(ValueError, readBlock, self.ram, numpy.zeros(4, dtype = numpy.uint32), 0, 8)
+
+    def testWithoutNumpy(self):
+        # a None entry in sys.modules makes "import numpy" fail, as if it wasn't installed
+        saved = sys.modules.get('numpy', None)
+        sys.modules['numpy'] = None
+        try:
+            self.assertRaises(ImportError, __import__, 'numpy')
+            data = array.array('I', range(16))
+            writeBlock(self.ram, data)
+            out = readBlock(self.ram)
+            self.assertTrue(isinstance(out, array.array))
+            self.assertEqual(out.typecode, 'I')
+            self.assertEqual(out, data)
+        finally:
+            if saved is None: del sys.modules['numpy']
+            else: sys.modules['numpy'] = saved
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+# the compiled address table cache: a truncated or corrupt cache file is parsed again instead of failing, run with
+#   python -m unittest discover scripts/tests
+
+import os, sys, shutil, tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import rw_reg
+from rw_reg import getCacheFilename, getNode, parseXML
+
+ADDRESS_TABLE = '''<?xml version="1.0" encoding="utf-8"?>
+<node id="top">
+  <node id="GEM_AMC" address="0x0">
+    <node id="RAM" address="0x100" mode="block" size="16" permission="rw"/>
+    <node id="OH%s" address="0x1000" generate="true" generate_size="12" generate_address_step="0x100" generate_idx_var="OH_IDX">
+      <node id="CTRL" address="0x0" mask="0x0000ffff" permission="rw"/>
+      <node id="STATUS" address="0x1" permission="r" sw_monitor_warn_min_threshold="1"/>
+    </node>
+  </node>
+</node>
+''' % '${OH_IDX}'
+
+class CacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.table = os.path.join(self.dir, 'table.xml')
+        f = open(self.table, 'w')
+        f.write(ADDRESS_TABLE)
+        f.close()
+        self.saved = rw_reg.ADDRESS_TABLE_CACHE_DIR, rw_reg.ADDRESS_TABLE_SHARED_DIR
+        rw_reg.ADDRESS_TABLE_CACHE_DIR = self.dir
+        rw_reg.ADDRESS_TABLE_SHARED_DIR = None
+
+    def tearDown(self):
+        rw_reg.ADDRESS_TABLE_CACHE_DIR, rw_reg.ADDRESS_TABLE_SHARED_DIR = self.saved
+        rw_reg.nodes.clear()
+        shutil.rmtree(self.dir)
+
+    def checkTable(self):
+        self.assertEqual(getNode('GEM_AMC.OH11.STATUS').address, 0x1b01)
+        self.assertEqual(getNode('GEM_AMC.OH3.CTRL').mask, 0xffff)
+        self.assertEqual(getNode('GEM_AMC.RAM').size, '16')
+
+    # writes the cache, damages it with damage(data) and parses the table again
+    def reloadDamaged(self, shared, damage):
+        parseXML(self.table, shared = shared)
+        cache = getCacheFilename(self.table, None, None, shared)
+        self.assertTrue(os.path.exists(cache))
+        f = open(cache, 'rb')
+        data = f.read()
+        f.close()
+        os.remove(cache)
+        f = open(cache, 'wb')
+        f.write(damage(data))
+        f.close()
+        parseXML(self.table, shared = shared)
+        self.checkTable()
+
+    def testCached(self):
+        for shared in (False, True):
+            parseXML(self.table, shared = shared)
+            parseXML(self.table, shared = shared)
+            self.checkTable()
+
+    def testTruncated(self):
+        for shared in (False, True):
+            self.reloadDamaged(shared, lambda data: data[:len(data) // 2])
+            self.reloadDamaged(shared, lambda data: data[:rw_reg.CACHE_HEADER.size - 1])
+
+    def testCorrupt(self):
+        for shared in (False, True):
+            # the extras are the json at the end
+            self.reloadDamaged(shared, lambda data: data[:-4] + 'xxxx')
+            # a wrong name segments length in the header
+            self.reloadDamaged(shared, lambda data: data[:rw_reg.CACHE_HEADER.size - 8] + '\xff\xff\xff\x7f' + data[rw_reg.CACHE_HEADER.size - 4:])
+
+if __name__ == '__main__':
+    unittest.main()